@@ -0,0 +1,214 @@
+"""Accounts-receivable analytics computed on columnar frames.
+
+Open installments and debts are streamed from MongoDB in batches into pandas
+frames, and the reports are computed with vectorized operations over those
+columns instead of a Python loop per document. Payments made outside the
+installment schedule are credited to a debt's oldest open installments, so
+the outstanding amounts add up to the debts' `remaining_amount`.
+"""
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime, timezone
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+
+# ============= MODELS =============
+
+class AgingBucket(BaseModel):
+    bucket: str  # current, 1-30, 31-60, 61-90, 90+
+    installment_count: int
+    debt_count: int
+    amount: float
+
+class DelinquencyRate(BaseModel):
+    key: Optional[str] = None
+    open_debts: int
+    delinquent_debts: int  # with an installment past due
+    rate: float
+    overdue_amount: float
+
+class AgingReport(BaseModel):
+    as_of: datetime
+    total_outstanding: float
+    buckets: List[AgingBucket]
+    by_product_type: List[DelinquencyRate]
+    by_installment_type: List[DelinquencyRate]
+
+class CashflowWeek(BaseModel):
+    week_start: datetime  # Monday, 00:00 UTC
+    installment_count: int
+    expected_amount: float
+
+class CashflowReport(BaseModel):
+    as_of: datetime
+    overdue_amount: float  # due before the current week and still unpaid
+    weeks: List[CashflowWeek]
+
+# ============= FRAMES =============
+
+INSTALLMENT_COLUMNS = ["debt_id", "amount", "due_date"]
+DEBT_COLUMNS = ["id", "product_type", "installment_type", "remaining_amount"]
+OPEN_STATUSES = ["pending", "partial", "overdue"]
+
+AGING_BUCKETS = ["current", "1-30", "31-60", "61-90", "90+"]
+
+def frame_from_batches(batches, columns: List[str]) -> pd.DataFrame:
+    frames = [pd.DataFrame.from_records(batch, columns=columns) for batch in batches if batch]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+async def load_frame(cursor, columns: List[str], batch_size: int) -> pd.DataFrame:
+    """Drain a cursor batch by batch into one frame with the given columns"""
+    batches = []
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            break
+        batches.append(batch)
+    return frame_from_batches(batches, columns)
+
+async def load_open_installments(db, batch_size: int) -> pd.DataFrame:
+    cursor = db.installments.find(
+        {"paid": False}, {"_id": 0, **{column: 1 for column in INSTALLMENT_COLUMNS}}, batch_size=batch_size
+    )
+    return await load_frame(cursor, INSTALLMENT_COLUMNS, batch_size)
+
+async def load_open_debts(db, batch_size: int) -> pd.DataFrame:
+    cursor = db.debts.find(
+        {"status": {"$in": OPEN_STATUSES}}, {"_id": 0, **{column: 1 for column in DEBT_COLUMNS}}, batch_size=batch_size
+    )
+    return await load_frame(cursor, DEBT_COLUMNS, batch_size)
+
+# ============= COMPUTATIONS =============
+# Installments are joined to debts through integer positions in the debt frame,
+# so per-debt sums and counts are np.bincount calls instead of string groupbys.
+
+NAT = np.datetime64("NaT").view("i8")
+DAY_NS = 86_400 * 10**9
+WEEK_NS = 7 * DAY_NS
+AGING_EDGES = np.array([0, 30, 60, 90])  # upper bounds in days past due
+
+def timestamps_ns(values) -> np.ndarray:
+    """UTC nanoseconds since the epoch; missing or invalid dates become NaT"""
+    return pd.to_datetime(values, utc=True, errors="coerce").to_numpy(dtype="datetime64[ns]").view("i8")
+
+def outstanding_installments(installments: pd.DataFrame, debts: pd.DataFrame):
+    """(debt position, due ns, outstanding amount) of the open installments of open debts"""
+    positions = pd.Index(debts["id"]).get_indexer(installments["debt_id"])
+    linked = positions >= 0
+    positions = positions[linked]
+    amount = installments["amount"].to_numpy(dtype=float)[linked]
+    due = timestamps_ns(installments["due_date"])[linked]
+
+    # Per debt, oldest first; installments without a due date go last
+    order = np.lexsort((np.where(due == NAT, np.iinfo(np.int64).max, due), positions))
+    positions, amount, due = positions[order], amount[order], due[order]
+
+    # What was paid outside the schedule covers the oldest installments first
+    scheduled = np.bincount(positions, weights=amount, minlength=len(debts))
+    remaining = debts["remaining_amount"].to_numpy(dtype=float)
+    remaining = np.where(np.isnan(remaining), scheduled, remaining)
+    credit = np.clip(scheduled - remaining, 0, None)
+    before = np.cumsum(amount) - amount
+    paid_before = before - before[np.searchsorted(positions, positions)]
+    outstanding = amount - np.clip(credit[positions] - paid_before, 0, amount)
+
+    keep = outstanding > 0.005
+    return positions[keep], due[keep], outstanding[keep]
+
+def days_past_due(due: np.ndarray, as_of: datetime) -> np.ndarray:
+    """Whole days since each due date; installments without one count as current"""
+    days = (timestamps_ns([as_of])[0] - due) // DAY_NS
+    return np.where(due == NAT, 0, days)
+
+def delinquency_rates(debts: pd.DataFrame, field: str) -> List[DelinquencyRate]:
+    rows = debts.groupby(field, dropna=False).agg(
+        open_debts=("id", "size"),
+        delinquent_debts=("delinquent", "sum"),
+        overdue_amount=("overdue_amount", "sum")
+    )
+    rows["rate"] = rows["delinquent_debts"] / rows["open_debts"]
+    rows = rows.sort_values("rate", ascending=False)
+    return [
+        DelinquencyRate(
+            key=None if pd.isna(key) else key,
+            open_debts=int(row.open_debts),
+            delinquent_debts=int(row.delinquent_debts),
+            rate=float(row.rate),
+            overdue_amount=float(row.overdue_amount)
+        )
+        for key, row in rows.iterrows()
+    ]
+
+def compute_aging(installments: pd.DataFrame, debts: pd.DataFrame, as_of: datetime) -> AgingReport:
+    positions, due, outstanding = outstanding_installments(installments, debts)
+    days = days_past_due(due, as_of)
+    buckets = np.searchsorted(AGING_EDGES, days, side="left")
+    counts = np.bincount(buckets, minlength=len(AGING_BUCKETS))
+    amounts = np.bincount(buckets, weights=outstanding, minlength=len(AGING_BUCKETS))
+    # A debt is counted once per bucket it has installments in
+    debt_counts = np.bincount(np.unique(buckets * len(debts) + positions) // max(len(debts), 1),
+                              minlength=len(AGING_BUCKETS))
+
+    overdue = days > 0
+    debts = debts.assign(
+        delinquent=np.bincount(positions[overdue], minlength=len(debts)) > 0,
+        overdue_amount=np.bincount(positions[overdue], weights=outstanding[overdue], minlength=len(debts))
+    )
+    return AgingReport(
+        as_of=as_of,
+        total_outstanding=float(outstanding.sum()),
+        buckets=[
+            AgingBucket(bucket=bucket, installment_count=int(counts[i]),
+                        debt_count=int(debt_counts[i]), amount=float(amounts[i]))
+            for i, bucket in enumerate(AGING_BUCKETS)
+        ],
+        by_product_type=delinquency_rates(debts, "product_type"),
+        by_installment_type=delinquency_rates(debts, "installment_type")
+    )
+
+def week_start(as_of: datetime) -> pd.Timestamp:
+    """The Monday 00:00 UTC of the week as_of falls in"""
+    day = pd.Timestamp(as_of).tz_convert("UTC").floor("D")
+    return day - pd.Timedelta(days=day.weekday())
+
+def compute_cashflow(installments: pd.DataFrame, debts: pd.DataFrame, as_of: datetime, weeks: int) -> CashflowReport:
+    _, due, outstanding = outstanding_installments(installments, debts)
+    dated = due != NAT
+    due, outstanding = due[dated], outstanding[dated]
+    current_week = week_start(as_of)
+    week = (due - current_week.value) // WEEK_NS
+    overdue = week < 0
+    upcoming = ~overdue & (week < weeks)
+    counts = np.bincount(week[upcoming], minlength=weeks)
+    amounts = np.bincount(week[upcoming], weights=outstanding[upcoming], minlength=weeks)
+    return CashflowReport(
+        as_of=as_of,
+        overdue_amount=float(outstanding[overdue].sum()),
+        weeks=[
+            CashflowWeek(
+                week_start=(current_week + pd.Timedelta(weeks=i)).to_pydatetime(),
+                installment_count=int(counts[i]),
+                expected_amount=float(amounts[i])
+            )
+            for i in range(weeks)
+        ]
+    )
+
+# ============= REPORTS =============
+
+async def load_frames(db, batch_size: int):
+    return await asyncio.gather(load_open_installments(db, batch_size), load_open_debts(db, batch_size))
+
+async def aging_report(db, batch_size: int = 5000) -> AgingReport:
+    installments, debts = await load_frames(db, batch_size)
+    # The frame work is CPU bound; keep it off the event loop
+    return await asyncio.to_thread(compute_aging, installments, debts, datetime.now(timezone.utc))
+
+async def cashflow_report(db, weeks: int = 12, batch_size: int = 5000) -> CashflowReport:
+    installments, debts = await load_frames(db, batch_size)
+    return await asyncio.to_thread(compute_cashflow, installments, debts, datetime.now(timezone.utc), weeks)
@@ -0,0 +1,163 @@
+"""Ledger reconciliation between debts, payments and installments.
+
+Debts are walked in `id` order in batches. For each batch the payments and
+installments of those debts are grouped inside the database and compared with
+the denormalized totals on the debts. Progress is checkpointed on the run
+document after every batch, so a run can be stopped at any time and resumed
+later; nothing is locked and only one batch is held in memory.
+"""
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Union
+from datetime import datetime, timezone
+import uuid
+
+
+# Differences below this are rounding noise
+EPSILON = 0.01
+
+# ============= MODELS =============
+
+class ReconciliationRun(BaseModel):
+    id: str
+    status: str  # running, completed
+    last_debt_id: Optional[str] = None
+    debts_checked: int = 0
+    discrepancies: int = 0
+    started_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
+
+class Discrepancy(BaseModel):
+    id: str
+    run_id: str
+    debt_id: str
+    field: str  # paid_amount, remaining_amount, status, installments
+    expected: Union[float, str]
+    actual: Union[float, str]
+    detected_at: datetime
+
+# ============= PIPELINES =============
+
+def payment_totals_pipeline(debt_ids: List[str]):
+    return [
+        {"$match": {"debt_id": {"$in": debt_ids}}},
+        {"$group": {
+            "_id": "$debt_id",
+            "paid": {"$sum": "$amount"},
+            # Paying an installment records a payment with this method
+            "installment_paid": {"$sum": {"$cond": [{"$eq": ["$payment_method", "parcela"]}, "$amount", 0]}}
+        }}
+    ]
+
+def installment_totals_pipeline(debt_ids: List[str]):
+    return [
+        {"$match": {"debt_id": {"$in": debt_ids}, "paid": True}},
+        {"$group": {"_id": "$debt_id", "paid": {"$sum": "$amount"}}}
+    ]
+
+# ============= CHECKS =============
+
+def expected_status(debt: dict, paid: float) -> Optional[str]:
+    """The status the amounts imply, or None when any unpaid status is acceptable"""
+    if debt['total_amount'] - paid <= EPSILON:
+        return "paid"
+    if debt['status'] == "paid":
+        return "partial" if paid > EPSILON else "pending"
+    return None
+
+def compare_debt(debt: dict, payments: dict, installments: dict) -> List[tuple]:
+    """Return the (field, expected, actual) mismatches of one debt"""
+    paid = payments.get('paid', 0.0)
+    mismatches = []
+    if abs(debt.get('paid_amount', 0.0) - paid) > EPSILON:
+        mismatches.append(("paid_amount", paid, debt.get('paid_amount', 0.0)))
+    remaining = debt['total_amount'] - paid
+    if abs(debt.get('remaining_amount', 0.0) - remaining) > EPSILON:
+        mismatches.append(("remaining_amount", remaining, debt.get('remaining_amount', 0.0)))
+    status = expected_status(debt, paid)
+    if status and status != debt['status']:
+        mismatches.append(("status", status, debt['status']))
+    installment_paid = installments.get('paid', 0.0)
+    if abs(payments.get('installment_paid', 0.0) - installment_paid) > EPSILON:
+        mismatches.append(("installments", payments.get('installment_paid', 0.0), installment_paid))
+    return mismatches
+
+async def check_batch(db, debts: List[dict]) -> Dict[str, List]:
+    debt_ids = [debt['id'] for debt in debts]
+    payments = {row['_id']: row async for row in db.payments.aggregate(payment_totals_pipeline(debt_ids))}
+    installments = {row['_id']: row async for row in db.installments.aggregate(installment_totals_pipeline(debt_ids))}
+    found = {}
+    for debt in debts:
+        mismatches = compare_debt(debt, payments.get(debt['id'], {}), installments.get(debt['id'], {}))
+        if mismatches:
+            found[debt['id']] = mismatches
+    return found
+
+DEBT_PROJECTION = {"_id": 0, "id": 1, "total_amount": 1, "paid_amount": 1, "remaining_amount": 1, "status": 1}
+
+# ============= RUNS =============
+
+async def start_run(db) -> ReconciliationRun:
+    now = datetime.now(timezone.utc)
+    run = ReconciliationRun(id=str(uuid.uuid4()), status="running", started_at=now, updated_at=now)
+    await db.reconciliation_runs.insert_one(run.model_dump())
+    return run
+
+async def current_run(db) -> Optional[ReconciliationRun]:
+    """The most recent run that has not finished yet"""
+    doc = await db.reconciliation_runs.find_one({"status": "running"}, {"_id": 0}, sort=[("started_at", -1)])
+    return ReconciliationRun(**doc) if doc else None
+
+async def get_run(db, run_id: str) -> Optional[ReconciliationRun]:
+    doc = await db.reconciliation_runs.find_one({"id": run_id}, {"_id": 0})
+    return ReconciliationRun(**doc) if doc else None
+
+async def reconcile(db, batch_size: int = 1000, max_batches: Optional[int] = None) -> ReconciliationRun:
+    """Resume the unfinished run (or start one) and check up to max_batches batches of debts"""
+    run = await current_run(db) or await start_run(db)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        query = {"id": {"$gt": run.last_debt_id}} if run.last_debt_id else {}
+        debts = await db.debts.find(query, DEBT_PROJECTION).sort("id", 1).limit(batch_size).to_list(batch_size)
+        now = datetime.now(timezone.utc)
+        if not debts:
+            run.status = "completed"
+            run.completed_at = now
+            run.updated_at = now
+            await db.reconciliation_runs.update_one(
+                {"id": run.id},
+                {"$set": {"status": run.status, "completed_at": now, "updated_at": now}}
+            )
+            break
+
+        found = await check_batch(db, debts)
+        if found:
+            # Writes may have landed between reading the debts and the grouped
+            # totals; only mismatches that survive a second look are reported
+            rechecked = await db.debts.find({"id": {"$in": list(found)}}, DEBT_PROJECTION).to_list(None)
+            found = await check_batch(db, rechecked)
+        discrepancies = [
+            Discrepancy(
+                id=str(uuid.uuid4()), run_id=run.id, debt_id=debt_id,
+                field=field, expected=expected, actual=actual, detected_at=now
+            ).model_dump()
+            for debt_id, mismatches in found.items()
+            for field, expected, actual in mismatches
+        ]
+        if discrepancies:
+            await db.reconciliation_discrepancies.insert_many(discrepancies)
+
+        # Checkpoint: a resumed run continues after the last debt of this batch
+        run.last_debt_id = debts[-1]['id']
+        run.debts_checked += len(debts)
+        run.discrepancies += len(discrepancies)
+        run.updated_at = now
+        await db.reconciliation_runs.update_one(
+            {"id": run.id},
+            {
+                "$set": {"last_debt_id": run.last_debt_id, "updated_at": now},
+                "$inc": {"debts_checked": len(debts), "discrepancies": len(discrepancies)}
+            }
+        )
+        batches += 1
+    return run
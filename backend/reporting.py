@@ -0,0 +1,150 @@
+"""Report computations expressed as MongoDB aggregation pipelines.
+
+Every report here is reduced inside the database; only the grouped rows are
+sent back to the API process.
+"""
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime, timezone
+
+
+# ============= MODELS =============
+
+class DebtBreakdown(BaseModel):
+    key: Optional[str] = None
+    debt_count: int
+    total_amount: float
+    paid_amount: float
+    remaining_amount: float
+
+class MonthlyTotals(BaseModel):
+    month: str  # YYYY-MM
+    debts_count: int = 0
+    debts_amount: float = 0.0
+    payments_count: int = 0
+    payments_amount: float = 0.0
+
+class CustomerTotals(BaseModel):
+    customer_name: str
+    debt_count: int
+    total_amount: float
+    paid_amount: float
+    remaining_amount: float
+
+class DebtTotals(BaseModel):
+    total_debts: float = 0.0
+    total_paid: float = 0.0
+    debt_count: int = 0
+
+class ReportSummary(BaseModel):
+    totals: DebtTotals
+    by_status: List[DebtBreakdown]
+    by_product_type: List[DebtBreakdown]
+    by_installment_type: List[DebtBreakdown]
+    by_month: List[MonthlyTotals]
+    generated_at: datetime
+
+# ============= PIPELINES =============
+
+BREAKDOWN_FIELDS = ['status', 'product_type', 'installment_type']
+
+def debt_totals_pipeline():
+    return [
+        {"$group": {
+            "_id": None,
+            "total_debts": {"$sum": "$remaining_amount"},
+            "total_paid": {"$sum": "$paid_amount"},
+            "debt_count": {"$sum": 1}
+        }}
+    ]
+
+def debt_breakdown_pipeline(field: str):
+    if field not in BREAKDOWN_FIELDS:
+        raise ValueError(f"Unsupported breakdown field: {field}")
+    return [
+        {"$group": {
+            "_id": f"${field}",
+            "debt_count": {"$sum": 1},
+            "total_amount": {"$sum": "$total_amount"},
+            "paid_amount": {"$sum": "$paid_amount"},
+            "remaining_amount": {"$sum": "$remaining_amount"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "key": "$_id",
+            "debt_count": 1,
+            "total_amount": 1,
+            "paid_amount": 1,
+            "remaining_amount": 1
+        }},
+        {"$sort": {"remaining_amount": -1}}
+    ]
+
+def monthly_pipeline(date_field: str, amount_field: str):
+    # $toDate accepts both BSON dates and ISO strings
+    return [
+        {"$match": {date_field: {"$ne": None}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m", "date": {"$toDate": f"${date_field}"}}},
+            "count": {"$sum": 1},
+            "amount": {"$sum": f"${amount_field}"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+def customer_totals_pipeline(limit: int):
+    return [
+        {"$group": {
+            "_id": "$customer_name",
+            "debt_count": {"$sum": 1},
+            "total_amount": {"$sum": "$total_amount"},
+            "paid_amount": {"$sum": "$paid_amount"},
+            "remaining_amount": {"$sum": "$remaining_amount"}
+        }},
+        {"$sort": {"remaining_amount": -1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "customer_name": "$_id",
+            "debt_count": 1,
+            "total_amount": 1,
+            "paid_amount": 1,
+            "remaining_amount": 1
+        }}
+    ]
+
+# ============= REPORTS =============
+
+async def debt_totals(db, session=None) -> DebtTotals:
+    rows = await db.debts.aggregate(debt_totals_pipeline(), session=session).to_list(1)
+    if not rows:
+        return DebtTotals()
+    return DebtTotals(**rows[0])
+
+async def debt_breakdown(db, field: str) -> List[DebtBreakdown]:
+    rows = await db.debts.aggregate(debt_breakdown_pipeline(field)).to_list(None)
+    return [DebtBreakdown(**row) for row in rows]
+
+async def monthly_totals(db) -> List[MonthlyTotals]:
+    months = {}
+    async for row in db.debts.aggregate(monthly_pipeline("created_at", "total_amount")):
+        months[row['_id']] = MonthlyTotals(month=row['_id'], debts_count=row['count'], debts_amount=row['amount'])
+    async for row in db.payments.aggregate(monthly_pipeline("payment_date", "amount")):
+        month = months.setdefault(row['_id'], MonthlyTotals(month=row['_id']))
+        month.payments_count = row['count']
+        month.payments_amount = row['amount']
+    return [months[key] for key in sorted(months)]
+
+async def customer_totals(db, limit: int = 50) -> List[CustomerTotals]:
+    rows = await db.debts.aggregate(customer_totals_pipeline(limit), allowDiskUse=True).to_list(limit)
+    return [CustomerTotals(**row) for row in rows]
+
+async def build_summary(db) -> ReportSummary:
+    return ReportSummary(
+        totals=await debt_totals(db),
+        by_status=await debt_breakdown(db, 'status'),
+        by_product_type=await debt_breakdown(db, 'product_type'),
+        by_installment_type=await debt_breakdown(db, 'installment_type'),
+        by_month=await monthly_totals(db),
+        generated_at=datetime.now(timezone.utc)
+    )
@@ -0,0 +1,167 @@
+"""Daily rollups for historical trend reports.
+
+One small document per UTC day in `daily_rollups` holds that day's payments
+by method, new debts and overdue count. The rollup job only computes the
+days after the last one it stored (plus days marked stale by writes that
+change the past), so trend reports over months read one document per day
+instead of rescanning payments. Only today is computed on the fly, from the
+payment_date/created_at indexes; reports start at the first rolled-up day.
+"""
+from pydantic import BaseModel
+from typing import Dict, Iterable, List, Optional
+from datetime import date, datetime, time, timedelta, timezone
+
+
+STATE_ID = "daily"
+OPEN_STATUSES = ["pending", "partial", "overdue"]
+
+# ============= MODELS =============
+
+class MethodTotals(BaseModel):
+    count: int = 0
+    amount: float = 0.0
+
+class DailyRollup(BaseModel):
+    day: str  # YYYY-MM-DD, UTC
+    payments_count: int = 0
+    amount_collected: float = 0.0
+    payments_by_method: Dict[str, MethodTotals] = {}
+    new_debts: int = 0
+    new_debts_amount: float = 0.0
+    overdue_debts: int = 0  # open debts past due at the end of the day, as seen at computed_at
+    computed_at: Optional[datetime] = None  # None: not rolled up yet
+
+class RollupRunResult(BaseModel):
+    days_computed: List[str]
+    last_day: Optional[str] = None
+
+# ============= PIPELINES =============
+
+def day_bounds(day: date):
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+def payments_by_method_pipeline(start: datetime, end: datetime):
+    return [
+        {"$match": {"payment_date": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": "$payment_method", "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}}
+    ]
+
+def payment_days_pipeline(debt_ids: List[str]):
+    """Distinct UTC days with payments of these debts"""
+    return [
+        {"$match": {"debt_id": {"$in": debt_ids}}},
+        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$payment_date"}}}}
+    ]
+
+def new_debts_pipeline(start: datetime, end: datetime):
+    return [
+        {"$match": {"created_at": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "amount": {"$sum": "$total_amount"}}}
+    ]
+
+# ============= ROLLUPS =============
+
+async def compute_day(db, day: date) -> DailyRollup:
+    start, end = day_bounds(day)
+    by_method = {
+        row['_id'] or "otro": MethodTotals(count=row['count'], amount=row['amount'])
+        async for row in db.payments.aggregate(payments_by_method_pipeline(start, end))
+    }
+    debts = await db.debts.aggregate(new_debts_pipeline(start, end)).to_list(1)
+    overdue = await db.debts.count_documents({"status": {"$in": OPEN_STATUSES}, "due_date": {"$lt": end}})
+    return DailyRollup(
+        day=day.isoformat(),
+        payments_count=sum(totals.count for totals in by_method.values()),
+        amount_collected=sum(totals.amount for totals in by_method.values()),
+        payments_by_method=by_method,
+        new_debts=debts[0]['count'] if debts else 0,
+        new_debts_amount=debts[0]['amount'] if debts else 0.0,
+        overdue_debts=overdue,
+        computed_at=datetime.now(timezone.utc)
+    )
+
+async def store_day(db, day: date) -> DailyRollup:
+    rollup = await compute_day(db, day)
+    await db.daily_rollups.replace_one({"_id": rollup.day}, rollup.model_dump(), upsert=True)
+    return rollup
+
+async def first_day(db) -> Optional[date]:
+    """The earliest day with a debt or a payment"""
+    candidates = []
+    debt = await db.debts.find_one({"created_at": {"$ne": None}}, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)])
+    if debt:
+        candidates.append(debt['created_at'])
+    payment = await db.payments.find_one({"payment_date": {"$ne": None}}, {"_id": 0, "payment_date": 1}, sort=[("payment_date", 1)])
+    if payment:
+        candidates.append(payment['payment_date'])
+    return min(to_utc(value).date() for value in candidates) if candidates else None
+
+def to_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def day_keys(moments: Iterable[datetime]) -> List[str]:
+    return sorted({to_utc(moment).date().isoformat() for moment in moments if isinstance(moment, datetime)})
+
+async def mark_stale(db, days: Iterable[str], session=None):
+    """Queue these days (YYYY-MM-DD) for recomputation by the next run"""
+    days = sorted(set(days))
+    if days:
+        await db.rollup_state.update_one(
+            {"_id": STATE_ID}, {"$addToSet": {"stale": {"$each": days}}}, upsert=True, session=session
+        )
+
+async def run_rollups(db, today: Optional[date] = None, max_days: Optional[int] = None) -> RollupRunResult:
+    """Store the closed days after the last stored one, then recompute stale days"""
+    today = today or datetime.now(timezone.utc).date()
+    state = await db.rollup_state.find_one({"_id": STATE_ID}) or {}
+    last_day = state.get('last_day')
+    day = date.fromisoformat(last_day) + timedelta(days=1) if last_day else await first_day(db)
+
+    computed = []
+    while day and day < today and (max_days is None or len(computed) < max_days):
+        await store_day(db, day)
+        # Checkpoint after every day so an interrupted run resumes here
+        last_day = day.isoformat()
+        await db.rollup_state.update_one({"_id": STATE_ID}, {"$set": {"last_day": last_day}}, upsert=True)
+        computed.append(last_day)
+        day += timedelta(days=1)
+
+    for stale in sorted(state.get('stale', [])):
+        # Unmark first: a write during the recompute marks the day again
+        await db.rollup_state.update_one({"_id": STATE_ID}, {"$pull": {"stale": stale}})
+        if last_day is None or stale > last_day or stale in computed:
+            continue  # not stored yet, or just stored by the pass above
+        try:
+            await store_day(db, date.fromisoformat(stale))
+        except Exception:
+            await mark_stale(db, [stale])
+            raise
+        computed.append(stale)
+    return RollupRunResult(days_computed=computed, last_day=last_day)
+
+async def rollup_range(db, start: date, end: date) -> List[DailyRollup]:
+    """One rollup per day from start to end inclusive, clamped to the rolled-up days and today.
+
+    Stored days are read back and today is computed live; a closed day the job
+    has not reached yet comes back empty, without computed_at.
+    """
+    today = datetime.now(timezone.utc).date()
+    end = min(end, today)
+    first = await db.daily_rollups.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+    start = max(start, date.fromisoformat(first['_id']) if first else today)
+    stored = {
+        doc['_id']: DailyRollup(**doc)
+        async for doc in db.daily_rollups.find({"_id": {"$gte": start.isoformat(), "$lte": end.isoformat()}})
+    }
+    rollups = []
+    day = start
+    while day <= end:
+        if day.isoformat() in stored:
+            rollups.append(stored[day.isoformat()])
+        elif day == today:
+            rollups.append(await compute_day(db, day))
+        else:
+            rollups.append(DailyRollup(day=day.isoformat()))
+        day += timedelta(days=1)
+    return rollups
@@ -1,39 +1,138 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
 import os
+import io
+import asyncio
+import csv
+import json
+import base64
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import time
+import contextlib
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter, ValidationError, create_model
+from typing import Any, Dict, Generic, List, Optional, TypeVar
 import uuid
-from datetime import datetime, timezone, timedelta
+import unicodedata
+from datetime import date, datetime, timezone, timedelta
 from passlib.context import CryptContext
 import jwt
 
+import analytics
+import reconciliation
+import reporting
+import rollups
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection; dates are stored as native BSON dates and decoded as UTC-aware datetimes
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
 db = client[os.environ['DB_NAME']]
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '64'))
 
 # JWT settings
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Pagination
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Transactions
+TRANSACTION_MAX_ATTEMPTS = int(os.environ.get('TRANSACTION_MAX_ATTEMPTS', '5'))
+TRANSACTION_RETRY_DELAY_SECONDS = 0.05
+
+# Ledger reconciliation
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '1000'))
+
+# Batched installment payments
+MAX_BATCH_SIZE = 500
+
+# Customer linking and balance backfill
+CUSTOMER_BACKFILL_BATCH_SIZE = int(os.environ.get('CUSTOMER_BACKFILL_BATCH_SIZE', '1000'))
+
+# Overdue sweeper; 0 disables the background schedule
+OVERDUE_SWEEP_INTERVAL_SECONDS = int(os.environ.get('OVERDUE_SWEEP_INTERVAL_SECONDS', '60'))
+
+# Daily rollups; 0 disables the background schedule
+ROLLUP_INTERVAL_SECONDS = int(os.environ.get('ROLLUP_INTERVAL_SECONDS', '3600'))
+MAX_ROLLUP_RANGE_DAYS = 731
+
+# Cascade deletion: deleted documents are moved to archived_<collection> unless disabled
+ARCHIVE_DELETED = os.environ.get('ARCHIVE_DELETED', 'true').lower() in ('1', 'true', 'yes')
+# Orphan collector; 0 disables the background schedule
+ORPHAN_GC_INTERVAL_SECONDS = int(os.environ.get('ORPHAN_GC_INTERVAL_SECONDS', '3600'))
+ORPHAN_GC_BATCH_SIZE = int(os.environ.get('ORPHAN_GC_BATCH_SIZE', '500'))
+
+# Index diagnostics: run explain() on every route query shape at startup
+INDEX_DIAGNOSTICS = os.environ.get('INDEX_DIAGNOSTICS', 'false').lower() in ('1', 'true', 'yes')
+
+# Customer search
+SEARCH_MAX_PREFIX = 20
+SEARCH_MIN_PHONE_TOKEN = 3
+SEARCH_MIN_QUERY_CHARS = 3
+SEARCH_BACKFILL_BATCH_SIZE = 1000
+
+# Read-through cache
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '30'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+
+# Datetime migration
+DATETIME_MIGRATION_BATCH_SIZE = 1000
+
+# Bulk import
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '1000'))
+IMPORT_MAX_ERRORS = 1000
+IMPORT_MAX_RECORD_CHARS = 64 * 1024
+
+# Live events
+EVENT_COLLECTIONS = ["debts", "payments", "installments"]
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', '256'))
+EVENT_POLL_INTERVAL_SECONDS = float(os.environ.get('EVENT_POLL_INTERVAL_SECONDS', '2'))
+EVENT_HEARTBEAT_SECONDS = 15
+
+# Report export
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+
+# Dashboard aggregates
+AGGREGATES_TENANT = os.environ.get('AGGREGATES_TENANT', 'default')
+OVERDUE_COUNT_TTL_SECONDS = int(os.environ.get('OVERDUE_COUNT_TTL_SECONDS', '60'))
+AGGREGATES_REBUILD_LOCK_SECONDS = 300
+AGGREGATES_REBUILD_ATTEMPTS = 5
+AGGREGATES_REBUILD_POLL_SECONDS = 0.5
+
+# Aging/cashflow reports: read batch size, and how often their ETag rolls over
+# since days past due change with the clock
+ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', '5000'))
+ANALYTICS_PERIOD_SECONDS = int(os.environ.get('ANALYTICS_PERIOD_SECONDS', '300'))
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 # ============= MODELS =============
 
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -99,6 +198,7 @@ class Debt(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class DebtCreate(BaseModel):
+    customer_id: Optional[str] = None  # resolved from customer_name when omitted
     customer_name: str
     description: str
     product_type: str = "camisetas"
@@ -116,6 +216,7 @@ class Installment(BaseModel):
     due_date: Optional[datetime] = None
     paid: bool = False
     payment_date: Optional[datetime] = None
+    payment_id: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Payment(BaseModel):
@@ -135,6 +236,30 @@ class PaymentCreate(BaseModel):
     payment_method: str = "cash"
     notes: Optional[str] = None
 
+class InstallmentBatchPay(BaseModel):
+    # Either explicit installments, or the next `count` unpaid ones of a debt
+    installment_ids: List[str] = Field(default_factory=list, max_length=MAX_BATCH_SIZE)
+    debt_id: Optional[str] = None
+    count: Optional[int] = Field(None, ge=1, le=MAX_BATCH_SIZE)
+
+class InstallmentBatchResult(BaseModel):
+    paid: List[str]
+    skipped: List[str]
+    total_amount: float
+    payments: List[Payment]
+
+class StatementPayment(Payment):
+    balance: float  # remaining on the debt after this payment
+
+class StatementDebt(Debt):
+    installments: List[Installment] = []
+    payments: List[StatementPayment] = []
+
+class CustomerStatement(BaseModel):
+    customer: Customer
+    debts: List[StatementDebt]  # newest first, one page
+    next_cursor: Optional[str] = None
+
 class DashboardStats(BaseModel):
     total_customers: int
     total_debts: float
@@ -143,6 +268,63 @@ class DashboardStats(BaseModel):
     overdue_debts: int
     recent_payments: List[Payment]
 
+class IndexDiagnostic(BaseModel):
+    route: str
+    collection: str
+    stages: List[str]
+    collscan: bool
+
+class OverdueSweepResult(BaseModel):
+    swept: int
+    swept_at: datetime
+
+class OrphanCollectionResult(BaseModel):
+    installments: int
+    payments: int
+    collected_at: datetime
+
+class PasswordPoolMetrics(BaseModel):
+    workers: int
+    queue_limit: int
+    active: int
+    queued: int
+    saturation: float
+    completed: int
+    rejected: int
+    avg_duration_ms: float
+
+class AggregateDrift(BaseModel):
+    field: str
+    stored: float
+    actual: float
+    drift: float
+
+class AggregateRebuildReport(BaseModel):
+    rebuilt_at: datetime
+    drift: List[AggregateDrift]
+
+# Import rows may carry their own ids so later files can reference them
+class CustomerImport(CustomerCreate):
+    id: Optional[str] = None
+
+class DebtImport(DebtCreate):
+    id: Optional[str] = None
+    num_installments: int = Field(1, ge=1)
+
+class PaymentImport(PaymentCreate):
+    payment_date: Optional[datetime] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    collection: str
+    received: int = 0
+    inserted: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []  # first IMPORT_MAX_ERRORS only
+
 # ============= HELPER FUNCTIONS =============
 
 def verify_password(plain_password, hashed_password):
@@ -151,6 +333,46 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+class PasswordHashPool:
+    """Runs bcrypt on a bounded thread pool so it never blocks the event loop"""
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Only touched from the event loop thread
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_duration = 0.0
+
+    async def run(self, func, *args):
+        if self.in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Servidor ocupado, intenta nuevamente")
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_duration += time.perf_counter() - started
+
+    def metrics(self):
+        return PasswordPoolMetrics(
+            workers=self.workers,
+            queue_limit=self.queue_limit,
+            active=min(self.in_flight, self.workers),
+            queued=max(0, self.in_flight - self.workers),
+            saturation=self.in_flight / (self.workers + self.queue_limit),
+            completed=self.completed,
+            rejected=self.rejected,
+            avg_duration_ms=(self.total_duration / self.completed * 1000) if self.completed else 0.0
+        )
+
+password_pool = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -158,27 +380,1793 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def serialize_doc(doc):
-    """Convert datetime objects to ISO strings for MongoDB"""
-    if doc:
-        for key, value in doc.items():
-            if isinstance(value, datetime):
-                doc[key] = value.isoformat()
-    return doc
+def parse_datetime(value: str):
+    """Parse an ISO string, assuming UTC when it has no timezone"""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+# Large list responses are validated once through a cached TypeAdapter and
+# serialized to bytes by pydantic-core, bypassing FastAPI's response_model pass.
+_type_adapters = {}
+
+def model_json(response_type, content):
+    adapter = _type_adapters.get(response_type)
+    if adapter is None:
+        adapter = _type_adapters[response_type] = TypeAdapter(response_type)
+    return adapter.dump_json(adapter.validate_python(content))
+
+def json_response(body: bytes, headers: Optional[Dict[str, str]] = None):
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def model_response(response_type, content):
+    return json_response(model_json(response_type, content))
+
+def encode_cursor(doc, sort_field: str):
+    """Build an opaque keyset cursor from the last document of a page"""
+    value = doc.get(sort_field)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([value, doc['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; anything it could not have produced is a 400"""
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(value, dict) and list(value) == ["$date"]:
+            value = datetime.fromisoformat(value["$date"])
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    # Only plain values may reach the query, never operators
+    if not isinstance(value, (str, int, float, datetime, type(None))) or isinstance(value, bool) \
+            or not isinstance(last_id, str):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return value, last_id
+
+def keyset_query(query: dict, sort_field: str, direction: int, after: Optional[str]):
+    """Restrict a query to the documents after a cursor in (sort_field, id) order"""
+    if not after:
+        return query
+    value, last_id = decode_cursor(after)
+    op = "$lt" if direction < 0 else "$gt"
+    keyset = {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "id": {op: last_id}}
+    ]}
+    return {"$and": [query, keyset]} if query else keyset
+
+async def paginate(collection, query: dict, sort_field: str, direction: int, limit: int,
+                   after: Optional[str] = None, projection: Optional[dict] = None):
+    """Keyset pagination on (sort_field, id); returns (docs, next_cursor)"""
+    query = keyset_query(query, sort_field, direction, after)
+    docs = await collection.find(query, projection or {"_id": 0}) \
+        .sort([(sort_field, direction), ("id", direction)]) \
+        .limit(limit + 1) \
+        .to_list(limit + 1)
+    
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+    return docs, next_cursor
+
+# ============= SPARSE FIELDSETS =============
+# List routes accept `fields=a,b,c`. Only those fields, plus `id` and whatever
+# the route itself needs (such as the cursor's sort field), are projected from
+# MongoDB and serialized through a model holding just those fields.
+
+_sparse_models = {}
+
+def parse_fields(fields: Optional[str], model, *required: str) -> Optional[tuple]:
+    """Validate a fields= parameter; None means every field"""
+    if not fields:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = sorted(names - set(model.model_fields))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(unknown)}")
+    names |= {"id", *required}
+    return tuple(name for name in model.model_fields if name in names)
+
+def fields_projection(fields: tuple):
+    return {"_id": 0, **{name: 1 for name in fields}}
+
+def sparse_model(model, fields: Optional[tuple]):
+    """The model itself, or a cached copy restricted to the given fields"""
+    if not fields:
+        return model
+    key = (model, fields)
+    if key not in _sparse_models:
+        _sparse_models[key] = create_model(
+            f"{model.__name__}Fields",
+            __config__=ConfigDict(extra="ignore"),
+            **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields}
+        )
+    return _sparse_models[key]
+
+def build_installment_schedule(debt_id: str, num_installments: int, installment_amount: float,
+                               due_date: Optional[datetime], installment_type: str):
+    """Generate the installment documents of a debt, ready for insert_many"""
+    docs = []
+    for i in range(1, num_installments + 1):
+        # Calcular fecha de vencimiento de cada parcela
+        installment_due_date = None
+        if due_date:
+            if installment_type == "semanal":
+                installment_due_date = due_date + timedelta(weeks=(i-1))
+            elif installment_type == "mensual":
+                installment_due_date = due_date + timedelta(days=30*(i-1))
+            else:  # único
+                installment_due_date = due_date
+        
+        installment = Installment(
+            debt_id=debt_id,
+            installment_number=i,
+            amount=installment_amount,
+            due_date=installment_due_date
+        )
+        docs.append(installment.model_dump())
+    return docs
+
+def prepare_debt(debt_data: DebtCreate, **fields):
+    """Build a new debt and its installment documents from the create payload"""
+    due_date = parse_datetime(debt_data.due_date) if debt_data.due_date else None
+    
+    # Calcular el valor de cada parcela
+    installment_amount = debt_data.total_amount / debt_data.num_installments
+    
+    debt = Debt(
+        customer_id=debt_data.customer_id,
+        customer_name=debt_data.customer_name,
+        description=debt_data.description,
+        product_type=debt_data.product_type,
+        installment_type=debt_data.installment_type,
+        num_installments=debt_data.num_installments,
+        installment_amount=installment_amount,
+        total_amount=debt_data.total_amount,
+        remaining_amount=debt_data.total_amount,
+        due_date=due_date,
+        **fields
+    )
+    installment_docs = build_installment_schedule(
+        debt.id, debt_data.num_installments, installment_amount, due_date, debt_data.installment_type
+    )
+    return debt, installment_docs
+
+def installment_payment(installment: dict, debt: dict, payment_id: str, payment_date: datetime, amount: float):
+    """The payment record created when an installment is marked as paid"""
+    return Payment(
+        id=payment_id,
+        debt_id=installment['debt_id'],
+        customer_id=debt.get('customer_id', ''),
+        customer_name=debt['customer_name'],
+        amount=amount,
+        payment_method='parcela',
+        notes=f"Pago de parcela {installment['installment_number']}",
+        payment_date=payment_date
+    )
+
+# ============= ONE-TIME MIGRATIONS =============
+# Startup migrations and backfills record their completion in `migrations`, so
+# later boots skip their collection scans. The maintenance commands run them
+# regardless.
+
+async def run_once(name: str, migrate):
+    """Run a startup migration unless an earlier run completed it"""
+    if await db.migrations.find_one({"_id": name}):
+        return None
+    result = await migrate()
+    await db.migrations.update_one(
+        {"_id": name}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True
+    )
+    return result
+
+# ============= DATETIME MIGRATION =============
+# Older documents hold dates as ISO strings. This converts them to BSON dates
+# in place, batch by batch in _id order, while the API keeps serving.
+
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "customers": ["created_at"],
+    "debts": ["created_at", "due_date"],
+    "installments": ["created_at", "due_date", "payment_date"],
+    "payments": ["payment_date"],
+}
+
+async def migrate_datetime_fields():
+    migrated = {}
+    for collection, fields in DATETIME_FIELDS.items():
+        string_filter = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        projection = {field: 1 for field in fields}
+        last_id = None
+        migrated[collection] = 0
+        while True:
+            query = {"$and": [string_filter, {"_id": {"$gt": last_id}}]} if last_id else string_filter
+            batch = await db[collection].find(query, projection) \
+                .sort("_id", 1) \
+                .limit(DATETIME_MIGRATION_BATCH_SIZE) \
+                .to_list(DATETIME_MIGRATION_BATCH_SIZE)
+            if not batch:
+                break
+            updates = []
+            for doc in batch:
+                changes = {}
+                for field in fields:
+                    if isinstance(doc.get(field), str):
+                        try:
+                            changes[field] = parse_datetime(doc[field])
+                        except ValueError:
+                            logger.warning("Skipping unparseable %s.%s on %s: %r", collection, field, doc['_id'], doc[field])
+                if changes:
+                    # Only convert values that are still strings, in case a route rewrote them meanwhile
+                    updates.append(UpdateOne(
+                        {"_id": doc['_id'], **{field: doc[field] for field in changes}},
+                        {"$set": changes}
+                    ))
+            if updates:
+                await db[collection].bulk_write(updates, ordered=False)
+            migrated[collection] += len(updates)
+            last_id = batch[-1]['_id']
+        if migrated[collection]:
+            logger.info("Migrated string dates on %d %s", migrated[collection], collection)
+    await mark_changed(*[collection for collection, count in migrated.items() if count])
+    return migrated
+
+# ============= TRANSACTIONS =============
+
+_transactions_supported = None
+
+async def supports_transactions():
+    """Transactions need a replica set or sharded cluster, not a standalone mongod"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await client.admin.command("hello")
+        _transactions_supported = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+    return _transactions_supported
+
+class UnitOfWork:
+    """Writes that commit or roll back together.
+
+    Routes pass a `work(uow)` coroutine function to UnitOfWork.run() and hand
+    `uow.session` to every Motor call inside it. The whole function is re-run
+    when the transaction hits a transient error, so it must not have side
+    effects outside the database; cache invalidation goes after run()
+    returns. On a standalone mongod `session` is None and the writes run
+    without atomicity.
+    """
+
+    def __init__(self, session=None, attempt: int = 1):
+        self.session = session
+        self.attempt = attempt
+
+    @classmethod
+    async def run(cls, work):
+        if not await supports_transactions():
+            return await work(cls())
+        async with await client.start_session() as session:
+            attempt = 1
+            while True:
+                session.start_transaction()
+                try:
+                    result = await work(cls(session, attempt))
+                    await cls.commit(session)
+                    return result
+                except PyMongoError as e:
+                    if session.in_transaction:
+                        await session.abort_transaction()
+                    if not e.has_error_label("TransientTransactionError") or attempt >= TRANSACTION_MAX_ATTEMPTS:
+                        raise
+                except BaseException:
+                    if session.in_transaction:
+                        await session.abort_transaction()
+                    raise
+                logger.info("Retrying transaction after transient error (attempt %d)", attempt)
+                await asyncio.sleep(TRANSACTION_RETRY_DELAY_SECONDS * attempt)
+                attempt += 1
+
+    @staticmethod
+    async def commit(session):
+        # The commit itself may be retried when its outcome is unknown
+        for attempt in range(1, TRANSACTION_MAX_ATTEMPTS + 1):
+            try:
+                await session.commit_transaction()
+                return
+            except PyMongoError as e:
+                if not e.has_error_label("UnknownTransactionCommitResult") or attempt == TRANSACTION_MAX_ATTEMPTS:
+                    raise
+
+async def check_transactions():
+    """Exercise rollback and transient-error retry; run against a (single-node) replica set"""
+    if not await supports_transactions():
+        return {"transactions": False}
+    marker = str(uuid.uuid4())
+
+    async def failing_work(uow):
+        await db.transaction_checks.insert_one({"_id": f"{marker}-rollback"}, session=uow.session)
+        raise RuntimeError("rollback")
+
+    async def flaky_work(uow):
+        await db.transaction_checks.insert_one({"_id": f"{marker}-retry"}, session=uow.session)
+        if uow.attempt == 1:
+            raise OperationFailure("simulated conflict", 112, {"errorLabels": ["TransientTransactionError"]})
+        return uow.attempt
+
+    try:
+        await UnitOfWork.run(failing_work)
+    except RuntimeError:
+        pass
+    attempts = await UnitOfWork.run(flaky_work)
+    rolled_back = not await db.transaction_checks.count_documents({"_id": f"{marker}-rollback"})
+    committed = bool(await db.transaction_checks.count_documents({"_id": f"{marker}-retry"}))
+    await db.transaction_checks.delete_many({"_id": {"$regex": f"^{marker}"}})
+    return {"transactions": True, "rolled_back": rolled_back, "retried": attempts == 2 and committed}
+
+# ============= CACHE =============
+# Read-through cache for the read routes. Entries live under a namespace named
+# after the collection they come from, and mutating routes drop whole
+# namespaces through mark_changed(). Concurrent misses on the same key share a
+# single load. The storage is pluggable: InMemoryCacheBackend is per process;
+# a shared backend (e.g. Redis) only has to implement CacheBackend.
+# `python server.py check-cache` exercises AsyncCache on the in-memory backend.
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        """Return the cached value, or None on a miss"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float):
+        pass
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str):
+        pass
+
+class InMemoryCacheBackend(CacheBackend):
+    """TTL + LRU store local to this worker"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
 
-def deserialize_doc(doc):
-    """Convert ISO strings back to datetime objects"""
-    if doc:
-        datetime_fields = ['created_at', 'payment_date', 'due_date']
-        for field in datetime_fields:
-            if field in doc and isinstance(doc[field], str):
-                dt = datetime.fromisoformat(doc[field])
-                # Ensure timezone awareness
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
-                doc[field] = dt
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def delete_prefix(self, prefix):
+        for key in [key for key in self.entries if key.startswith(prefix)]:
+            del self.entries[key]
+
+class AsyncCache:
+    def __init__(self, backend: CacheBackend, ttl: float, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.inflight: Dict[str, asyncio.Future] = {}
+        # Bumped on invalidation so a load that started earlier is not stored
+        self.generations: Dict[str, int] = {}
+
+    async def get_or_load(self, namespace: str, key_parts: tuple, loader):
+        if not self.enabled:
+            return await loader()
+        key = f"{namespace}:{key_parts!r}"
+        value = await self.backend.get(key)
+        if value is not None:
+            return value
+        future = self.inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this caller was cancelled, not the shared load
+                # The caller that ran the load was cancelled; load again
+                return await self.get_or_load(namespace, key_parts, loader)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        generation = self.generations.get(namespace, 0)
+        try:
+            value = await loader()
+            if value is not None and self.generations.get(namespace, 0) == generation:
+                await self.backend.set(key, value, self.ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't log it as unretrieved
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self.inflight[key]
+
+    async def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            await self.backend.delete_prefix(f"{namespace}:")
+
+cache = AsyncCache(InMemoryCacheBackend(CACHE_MAX_ENTRIES), CACHE_TTL_SECONDS, CACHE_ENABLED)
+
+async def check_cache():
+    """Exercise single-flight, TTL/LRU eviction, invalidation and cancelled loads on an in-memory cache"""
+    test_cache = AsyncCache(InMemoryCacheBackend(max_entries=2), ttl=0.05)
+    loads = Counter()
+
+    async def loader(key, delay=0.01):
+        loads[key] += 1
+        await asyncio.sleep(delay)
+        return f"{key}-{loads[key]}"
+
+    values = await asyncio.gather(*(test_cache.get_or_load("ns", ("a",), lambda: loader("a")) for _ in range(10)))
+    single_flight = loads["a"] == 1 and set(values) == {"a-1"}
+
+    await asyncio.sleep(0.1)
+    expired = await test_cache.get_or_load("ns", ("a",), lambda: loader("a")) == "a-2"
+
+    for key in ["b", "c", "d"]:
+        await test_cache.get_or_load("ns", (key,), lambda key=key: loader(key))
+    evicted = await test_cache.backend.get("ns:('b',)") is None and len(test_cache.backend.entries) == 2
+
+    await test_cache.invalidate("ns")
+    invalidated = await test_cache.get_or_load("ns", ("d",), lambda: loader("d")) == "d-2"
+
+    # A load that started before an invalidation is returned but not stored
+    slow = asyncio.ensure_future(test_cache.get_or_load("ns", ("e",), lambda: loader("e", 0.02)))
+    await asyncio.sleep(0)
+    await test_cache.invalidate("ns")
+    stale_skipped = await slow == "e-1" and await test_cache.backend.get("ns:('e',)") is None
+
+    # Waiters on a cancelled load run it themselves instead of hanging
+    first = asyncio.ensure_future(test_cache.get_or_load("ns", ("f",), lambda: loader("f", 1)))
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(test_cache.get_or_load("ns", ("f",), lambda: loader("f")))
+    await asyncio.sleep(0)
+    first.cancel()
+    try:
+        waited = await asyncio.wait_for(waiter, 1) == "f-2"
+    except asyncio.TimeoutError:
+        waited = False
+    return {
+        "single_flight": single_flight,
+        "ttl_expiry": expired,
+        "lru_eviction": evicted,
+        "invalidation": invalidated,
+        "stale_load_skipped": stale_skipped,
+        "cancelled_load_released": waited and first.cancelled() and not test_cache.inflight,
+    }
+
+# Cached views derived from more than one collection
+DERIVED_NAMESPACES = {
+    "debts": ["dashboard", "analytics", "daily_rollups"],
+    "payments": ["dashboard", "daily_rollups"],
+    "installments": ["analytics"],
+}
+
+async def mark_changed(*collections: str):
+    """Call after writing to these collections so cached reads are refreshed"""
+    namespaces = set(collections)
+    for collection in collections:
+        namespaces.update(DERIVED_NAMESPACES.get(collection, []))
+    await cache.invalidate(*sorted(namespaces))
+    await bump_versions(*collections)
+
+# ============= CONDITIONAL REQUESTS =============
+# Each collection has a version counter in `collection_versions`, bumped by
+# mark_changed(). Read routes derive their ETag from the counters they depend
+# on, so a poll whose If-None-Match is still current gets a 304 after a single
+# lookup by _id. The ETag is also part of the cache key, which keeps a worker
+# from serving a body it cached before another worker's write.
+
+async def bump_versions(*collections: str):
+    if not collections:
+        return
+    await db.collection_versions.bulk_write([
+        UpdateOne({"_id": collection}, {"$inc": {"version": 1}}, upsert=True)
+        for collection in collections
+    ], ordered=False)
+
+async def collection_etag(collections: List[str], period: Optional[int] = None) -> str:
+    docs = await db.collection_versions.find({"_id": {"$in": collections}}).to_list(None)
+    versions = {doc['_id']: doc['version'] for doc in docs}
+    parts = [f"{collection}.{versions.get(collection, 0)}" for collection in collections]
+    if period:
+        # Views that depend on the clock are revalidated at least once per period
+        parts.append(f"t{int(time.time() // period)}")
+    return f'W/"{"-".join(parts)}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    weak = lambda tag: tag.strip().removeprefix("W/")
+    return any(weak(tag) == weak(etag) for tag in if_none_match.split(","))
+
+async def conditional_json(
+    request: Request,
+    namespace: str,
+    key_parts: tuple,
+    loader,
+    depends: Optional[List[str]] = None,
+    period: Optional[int] = None
+):
+    """Serve a cached JSON body tagged with an ETag, or 304 if the client's copy is current"""
+    etag = await collection_etag(depends or [namespace], period)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body = await cache.get_or_load(namespace, (*key_parts, etag), loader)
+    return json_response(body, headers)
+
+# ============= CUSTOMER SEARCH =============
+# Customers carry a `search_tokens` array with the accent-free prefixes of each
+# name word and the substrings of the phone digits, plus the normalized
+# `search_name`. Searches match whole tokens through a multikey index and are
+# ranked and paged in the database by a `search_key` computed per match; user
+# input never reaches a regex.
+
+SEARCH_FIELDS = ("search_tokens", "search_name")
+CUSTOMER_PROJECTION = {"_id": 0, **{field: 0 for field in SEARCH_FIELDS}}
+
+def normalize_text(value: str):
+    """Lowercase, strip accents and replace punctuation with spaces"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ''.join(ch if ch.isalnum() else ' ' for ch in stripped.lower())
+
+def phone_digits(value: str):
+    return ''.join(ch for ch in (value or '') if ch.isdigit())
+
+def customer_search_tokens(name: str, phone: str):
+    tokens = set()
+    for word in normalize_text(name).split():
+        for i in range(1, min(len(word), SEARCH_MAX_PREFIX) + 1):
+            tokens.add(word[:i])
+    digits = phone_digits(phone)
+    for start in range(len(digits)):
+        for end in range(start + SEARCH_MIN_PHONE_TOKEN, len(digits) + 1):
+            tokens.add(digits[start:end])
+    return sorted(tokens)
+
+def customer_search_fields(name: str, phone: str):
+    return {
+        "search_tokens": customer_search_tokens(name, phone),
+        "search_name": ' '.join(normalize_text(name).split())
+    }
+
+def customer_document(customer: Customer):
+    doc = customer.model_dump()
+    doc.update(customer_search_fields(customer.name, customer.phone))
+    # New customers start with correct (zero) balances
+    doc['balances_at'] = customer.created_at
     return doc
 
+def search_query_tokens(search: str):
+    """Turn user input into the tokens a matching customer must have"""
+    if not any(ch.isalpha() for ch in search):
+        digits = phone_digits(search)
+        if len(digits) >= SEARCH_MIN_PHONE_TOKEN:
+            return [digits]
+    return [word[:SEARCH_MAX_PREFIX] for word in normalize_text(search).split()]
+
+def search_pipeline(search: str, tokens: List[str], limit: int, after: Optional[str], projection: dict):
+    """Matches ranked exact name, whole-word name prefix, name prefix, phone, then any word match"""
+    query = ' '.join(normalize_text(search).split())
+    digits = phone_digits(search)
+    is_phone = {"$in": [digits, "$search_tokens"]} if len(digits) >= SEARCH_MIN_PHONE_TOKEN else False
+
+    def starts_with(prefix: str):
+        return {"$eq": [{"$substrCP": [{"$ifNull": ["$search_name", ""]}, 0, len(prefix)]}, prefix]}
+
+    rank = {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$search_name", query]}, "then": "0"},
+            {"case": starts_with(query + " "), "then": "1"},
+            {"case": starts_with(query), "then": "2"},
+            {"case": is_phone, "then": "3"}
+        ],
+        "default": "4"
+    }}
+    if any(projection.values()):
+        projection = {**projection, "search_key": 1}  # an inclusion projection from fields=
+    return [
+        {"$match": {"search_tokens": {"$all": tokens}}},
+        # Rank, then name, in one string so the (search_key, id) keyset cursor pages it
+        {"$addFields": {"search_key": {"$concat": [rank, " ", {"$ifNull": ["$search_name", ""]}]}}},
+        *([{"$match": keyset_query({}, "search_key", 1, after)}] if after else []),
+        {"$sort": {"search_key": 1, "id": 1}},
+        {"$limit": limit + 1},
+        {"$project": projection}
+    ]
+
+async def backfill_search_tokens():
+    """Add search tokens to customers created before they existed, in batches"""
+    updated = 0
+    while True:
+        batch = await db.customers.find(
+            {"search_name": {"$exists": False}},
+            {"_id": 0, "id": 1, "name": 1, "phone": 1}
+        ).limit(SEARCH_BACKFILL_BATCH_SIZE).to_list(SEARCH_BACKFILL_BATCH_SIZE)
+        if not batch:
+            break
+        await db.customers.bulk_write([
+            UpdateOne(
+                {"id": customer['id']},
+                {"$set": customer_search_fields(customer.get('name'), customer.get('phone'))}
+            )
+            for customer in batch
+        ], ordered=False)
+        updated += len(batch)
+    if updated:
+        logger.info("Backfilled search tokens for %d customers", updated)
+        await mark_changed("customers")
+    return updated
+
+# ============= LOCKS =============
+# Named locks in `maintenance_locks` keep a job to one worker at a time. A lock
+# expires on its own, so a worker that dies while holding it only delays the
+# next run.
+
+async def acquire_lock(name: str, seconds: float) -> Optional[str]:
+    """Take the lock unless another worker holds it; returns the owner token or None"""
+    owner = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    try:
+        await db.maintenance_locks.update_one(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    return owner
+
+async def release_lock(name: str, owner: str):
+    await db.maintenance_locks.delete_one({"_id": name, "owner": owner})
+
+# ============= DASHBOARD AGGREGATES =============
+# Totals shown on the dashboard are kept in `dashboard_aggregates` (one document
+# per tenant) and updated with $inc by every route that changes debt amounts.
+# Distinct customers are counted through `dashboard_customers`, which holds how
+# many debts each customer name currently has. Every $inc also bumps `seq` and
+# commits in the unit of work of the write that caused it. A rebuild reads the
+# totals and `seq` from one snapshot and only stores them if `seq` has not
+# moved since, so no write is counted both in the totals and by its $inc. On a
+# standalone mongod there are no snapshots or transactions, and a write that
+# lands during a rebuild can still be counted twice or missed until the next
+# rebuild.
+
+AGGREGATE_FIELDS = ['total_debts', 'total_paid', 'debt_count', 'total_customers']
+
+async def apply_dashboard_delta(remaining: float = 0.0, paid: float = 0.0, debts: int = 0, session=None):
+    """Apply an incremental change to the dashboard totals"""
+    inc = {}
+    if remaining:
+        inc['total_debts'] = remaining
+    if paid:
+        inc['total_paid'] = paid
+    if debts:
+        inc['debt_count'] = debts
+    update = {"$unset": {"overdue_as_of": ""}, "$inc": {**inc, "seq": 1}}
+    await db.dashboard_aggregates.update_one({"_id": AGGREGATES_TENANT}, update, upsert=True, session=session)
+
+async def track_customer_debts(customer_name: str, delta: int, session=None):
+    """Update the distinct customer count when a customer gains or loses debts"""
+    key = {"tenant": AGGREGATES_TENANT, "name": customer_name}
+    counter = await db.dashboard_customers.find_one_and_update(
+        {"_id": key},
+        {"$inc": {"debts": delta}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    customers_delta = 0
+    if delta > 0 and counter['debts'] == delta:
+        customers_delta = 1
+    elif delta < 0 and counter['debts'] <= 0:
+        customers_delta = -1
+        await db.dashboard_customers.delete_one({"_id": key, "debts": {"$lte": 0}}, session=session)
+    if customers_delta:
+        await db.dashboard_aggregates.update_one(
+            {"_id": AGGREGATES_TENANT},
+            {"$inc": {"total_customers": customers_delta, "seq": 1}},
+            upsert=True,
+            session=session
+        )
+
+async def add_customer_debts(counts: Dict[str, int], session=None):
+    """Bulk form of track_customer_debts for debts being added"""
+    result = await db.dashboard_customers.bulk_write([
+        UpdateOne({"_id": {"tenant": AGGREGATES_TENANT, "name": name}}, {"$inc": {"debts": count}}, upsert=True)
+        for name, count in counts.items()
+    ], ordered=False, session=session)
+    # A counter only exists while its customer has debts, so upserts are new customers
+    if result.upserted_count:
+        await db.dashboard_aggregates.update_one(
+            {"_id": AGGREGATES_TENANT},
+            {"$inc": {"total_customers": result.upserted_count, "seq": 1}},
+            upsert=True,
+            session=session
+        )
+
+async def count_overdue_debts(session=None):
+    now = datetime.now(timezone.utc)
+    return await db.debts.count_documents({
+        "status": {"$in": ["overdue", "pending", "partial"]},
+        "due_date": {"$lt": now}
+    }, session=session)
+
+async def snapshot_session():
+    """A session whose reads all see one point in time; a no-op context on a standalone mongod"""
+    if await supports_transactions():
+        return await client.start_session(snapshot=True)
+    return contextlib.nullcontext()
+
+async def rewrite_customer_counters(session=None) -> int:
+    """Replace the per-customer counters with the counts read in `session`; returns the distinct customers"""
+    names = set()
+    batch = []
+    async for row in db.debts.aggregate([
+        {"$group": {"_id": "$customer_name", "debts": {"$sum": 1}}}
+    ], allowDiskUse=True, session=session):
+        names.add(row['_id'])
+        batch.append(ReplaceOne(
+            {"_id": {"tenant": AGGREGATES_TENANT, "name": row['_id']}}, {"debts": row['debts']}, upsert=True
+        ))
+        if len(batch) >= 1000:
+            await db.dashboard_customers.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.dashboard_customers.bulk_write(batch, ordered=False)
+    # Drop the counters of names that no longer have debts
+    stale = [
+        doc['_id'] async for doc in db.dashboard_customers.find({"_id.tenant": AGGREGATES_TENANT}, {"_id": 1})
+        if doc['_id']['name'] not in names
+    ]
+    for i in range(0, len(stale), 1000):
+        await db.dashboard_customers.delete_many({"_id": {"$in": stale[i:i + 1000]}})
+    return len(names)
+
+async def rebuild_dashboard_aggregates() -> Optional[AggregateRebuildReport]:
+    """Recompute the dashboard aggregates from scratch and report drift; None while another worker rebuilds"""
+    lock = f"dashboard-aggregates:{AGGREGATES_TENANT}"
+    owner = await acquire_lock(lock, AGGREGATES_REBUILD_LOCK_SECONDS)
+    if not owner:
+        return None
+    try:
+        return await recompute_dashboard_aggregates()
+    finally:
+        await release_lock(lock, owner)
+
+async def recompute_dashboard_aggregates() -> AggregateRebuildReport:
+    for attempt in range(AGGREGATES_REBUILD_ATTEMPTS):
+        # The stored seq, the totals and the counters are all read from one snapshot
+        async with await snapshot_session() as session:
+            stored = await db.dashboard_aggregates.find_one({"_id": AGGREGATES_TENANT}, session=session) or {}
+            totals = {field: 0 for field in AGGREGATE_FIELDS}
+            totals.update((await reporting.debt_totals(db, session=session)).model_dump())
+            totals['total_customers'] = await rewrite_customer_counters(session)
+            overdue_count = await count_overdue_debts(session)
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches only if no write bumped seq since the snapshot, i.e. the
+            # snapshot holds every write; otherwise the upsert collides on _id
+            # and everything is read again
+            await db.dashboard_aggregates.replace_one(
+                {"_id": AGGREGATES_TENANT, "seq": stored.get('seq')},
+                {
+                    **totals,
+                    "seq": stored.get('seq', 0),
+                    "overdue_debts": overdue_count,
+                    "overdue_as_of": now,
+                    "rebuilt_at": now
+                },
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            logger.info("Dashboard aggregates changed during rebuild; recomputing (attempt %d)", attempt + 1)
+    else:
+        raise HTTPException(status_code=503, detail="Los totales cambiaron durante el recálculo; intente de nuevo")
+    await mark_changed("dashboard")
+
+    drift = [
+        AggregateDrift(
+            field=field,
+            stored=stored.get(field, 0),
+            actual=totals[field],
+            drift=totals[field] - stored.get(field, 0)
+        )
+        for field in AGGREGATE_FIELDS
+        if abs(totals[field] - stored.get(field, 0)) > 0.01
+    ]
+    if drift:
+        logger.warning(
+            "Dashboard aggregates drifted: %s",
+            ", ".join(f"{d.field}={d.drift:+}" for d in drift)
+        )
+    return AggregateRebuildReport(rebuilt_at=now, drift=drift)
+
+async def get_dashboard_aggregates():
+    """Read the maintained totals, refreshing the overdue count when stale"""
+    aggregates = await db.dashboard_aggregates.find_one({"_id": AGGREGATES_TENANT})
+    while not aggregates or 'rebuilt_at' not in aggregates:
+        if await rebuild_dashboard_aggregates() is None:
+            # Another worker is rebuilding; wait for its totals
+            await asyncio.sleep(AGGREGATES_REBUILD_POLL_SECONDS)
+        aggregates = await db.dashboard_aggregates.find_one({"_id": AGGREGATES_TENANT})
+
+    now = datetime.now(timezone.utc)
+    overdue_as_of = aggregates.get('overdue_as_of')
+    if not isinstance(overdue_as_of, datetime) or overdue_as_of < now - timedelta(seconds=OVERDUE_COUNT_TTL_SECONDS):
+        aggregates['overdue_debts'] = await count_overdue_debts()
+        await db.dashboard_aggregates.update_one(
+            {"_id": AGGREGATES_TENANT},
+            {"$set": {"overdue_debts": aggregates['overdue_debts'], "overdue_as_of": now}}
+        )
+    return aggregates
+
+# ============= CUSTOMER BALANCES =============
+# Debts reference their customer by `customer_id`, resolved from the name when
+# the client does not send it. Each customer's `total_debt` (remaining) and
+# `total_paid` are updated with $inc inside the unit of work of every route
+# that changes debt amounts, so the customer list can sort on them through an
+# index. Customers created before this existed have no `balances_at`; the
+# backfill links their debts and recomputes each such customer's balances in
+# its own unit of work, so on a replica set a concurrent $inc makes the
+# recompute retry instead of being overwritten.
+
+BALANCE_SORT_FIELDS = ["created_at", "total_debt", "total_paid"]
+
+async def customers_by_name(names) -> Dict[str, str]:
+    """Map each name shared by exactly one customer to that customer's id"""
+    matches = {}
+    async for customer in db.customers.find({"name": {"$in": list(names)}}, {"_id": 0, "id": 1, "name": 1}):
+        matches.setdefault(customer['name'], []).append(customer['id'])
+    return {name: ids[0] for name, ids in matches.items() if len(ids) == 1}
+
+async def resolve_debt_customer(debt_data: DebtCreate):
+    """Fill in customer_id (or the canonical name when an id was given)"""
+    if debt_data.customer_id:
+        customer = await db.customers.find_one({"id": debt_data.customer_id}, {"_id": 0, "name": 1})
+        if not customer:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        debt_data.customer_name = customer['name']
+    else:
+        debt_data.customer_id = (await customers_by_name([debt_data.customer_name])).get(debt_data.customer_name)
+
+async def apply_customer_balances(changes, session=None):
+    """$inc total_debt/total_paid for (customer_id, remaining, paid) changes"""
+    totals = {}
+    for customer_id, remaining, paid in changes:
+        if customer_id:
+            total = totals.setdefault(customer_id, [0.0, 0.0])
+            total[0] += remaining
+            total[1] += paid
+    if totals:
+        await db.customers.bulk_write([
+            UpdateOne({"id": customer_id}, {"$inc": {"total_debt": remaining, "total_paid": paid}})
+            for customer_id, (remaining, paid) in totals.items()
+        ], ordered=False, session=session)
+
+async def link_debt(debt_id: str, customer_id: str, session=None) -> int:
+    """Link one unlinked debt and credit its customer with the amounts the link saw"""
+    # Only the run whose update matched credits the balances, with the amounts
+    # as of that update; payments after it update the customer themselves
+    debt = await db.debts.find_one_and_update(
+        {"id": debt_id, "customer_id": {"$in": [None, ""]}},
+        {"$set": {"customer_id": customer_id}},
+        projection={"_id": 0, "remaining_amount": 1, "paid_amount": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if not debt:
+        return 0
+    await db.payments.update_many({"debt_id": debt_id}, {"$set": {"customer_id": customer_id}}, session=session)
+    # Customers without balances_at are recomputed from scratch by backfill_customer_balances
+    await apply_customer_balances(
+        [(customer_id, debt.get('remaining_amount', 0.0), debt.get('paid_amount', 0.0))], session=session
+    )
+    return 1
+
+async def link_debts_to_customers():
+    """Set customer_id on debts (and their payments) whose name matches exactly one customer"""
+    linked = 0
+    last_id = None
+    while True:
+        query = {"customer_id": {"$in": [None, ""]}}
+        if last_id:
+            query["id"] = {"$gt": last_id}
+        batch = await db.debts.find(
+            query, {"_id": 0, "id": 1, "customer_name": 1}
+        ).sort("id", 1).limit(CUSTOMER_BACKFILL_BATCH_SIZE).to_list(CUSTOMER_BACKFILL_BATCH_SIZE)
+        if not batch:
+            break
+        last_id = batch[-1]['id']
+        names = await customers_by_name({debt['customer_name'] for debt in batch})
+        for debt in batch:
+            customer_id = names.get(debt['customer_name'])
+            if customer_id:
+                linked += await UnitOfWork.run(
+                    lambda uow, debt_id=debt['id'], customer_id=customer_id: link_debt(debt_id, customer_id, uow.session)
+                )
+    if linked:
+        logger.info("Linked %d debts to customers", linked)
+        await mark_changed("customers", "debts", "payments")
+    return linked
+
+def customer_balances_pipeline(customer_ids: List[str]):
+    return [
+        {"$match": {"customer_id": {"$in": customer_ids}}},
+        {"$group": {
+            "_id": "$customer_id",
+            "total_debt": {"$sum": "$remaining_amount"},
+            "total_paid": {"$sum": "$paid_amount"}
+        }}
+    ]
+
+async def recompute_customer_balances(customer_id: str, session=None):
+    """Set one customer's balances from their debts; in a transaction a concurrent $inc forces a retry"""
+    totals = await db.debts.aggregate(customer_balances_pipeline([customer_id]), session=session).to_list(1)
+    await db.customers.update_one(
+        {"id": customer_id},
+        {"$set": {
+            "total_debt": totals[0]['total_debt'] if totals else 0.0,
+            "total_paid": totals[0]['total_paid'] if totals else 0.0,
+            "balances_at": datetime.now(timezone.utc)
+        }},
+        session=session
+    )
+
+async def backfill_customer_balances():
+    """Compute balances for customers that have never had them, one unit of work per customer"""
+    updated = 0
+    last_id = None
+    while True:
+        query = {"balances_at": {"$exists": False}}
+        if last_id:
+            query["id"] = {"$gt": last_id}
+        batch = await db.customers.find(query, {"_id": 0, "id": 1}) \
+            .sort("id", 1) \
+            .limit(CUSTOMER_BACKFILL_BATCH_SIZE) \
+            .to_list(CUSTOMER_BACKFILL_BATCH_SIZE)
+        if not batch:
+            break
+        for customer in batch:
+            await UnitOfWork.run(
+                lambda uow, customer_id=customer['id']: recompute_customer_balances(customer_id, uow.session)
+            )
+        updated += len(batch)
+        last_id = batch[-1]['id']
+    if updated:
+        logger.info("Backfilled balances for %d customers", updated)
+        await mark_changed("customers")
+    return updated
+
+async def backfill_customers(startup: bool = False):
+    # Linking finds unlinked debts through the customer_id index, so it runs on every
+    # startup; the balance backfill scans all customers and only runs until it completes
+    linked = await link_debts_to_customers()
+    if startup:
+        balances = await run_once("customer-balances", backfill_customer_balances)
+    else:
+        balances = await backfill_customer_balances()
+    return {"linked_debts": linked, "balances": balances}
+
+async def rebuild_customer_balances():
+    """Recompute every customer's balances from the debts"""
+    await db.customers.update_many({}, {"$unset": {"balances_at": ""}})
+    return await backfill_customer_balances()
+
+# ============= CUSTOMER STATEMENT =============
+# A customer's debts with their installments and payments come from a single
+# aggregation: a page of the customer's debts (customer_id, created_at, id
+# index) with both child collections joined by $lookup on the debt_id indexes.
+
+STATEMENT_DEPENDS = ["customers", "debts", "installments", "payments"]
+
+def statement_pipeline(customer_id: str, limit: int, after: Optional[str]):
+    return [
+        {"$match": keyset_query({"customer_id": customer_id}, "created_at", -1, after)},
+        {"$sort": {"created_at": -1, "id": -1}},
+        {"$limit": limit + 1},
+        {"$lookup": {"from": "installments", "localField": "id", "foreignField": "debt_id", "as": "installments"}},
+        {"$lookup": {"from": "payments", "localField": "id", "foreignField": "debt_id", "as": "payments"}},
+        {"$project": {"_id": 0, "installments._id": 0, "payments._id": 0}}
+    ]
+
+def add_running_balances(debt: dict):
+    """Order the joined children and give each payment the balance left after it"""
+    debt['installments'].sort(key=lambda installment: installment['installment_number'])
+    debt['payments'].sort(key=lambda payment: (payment['payment_date'], payment['id']))
+    balance = debt['total_amount']
+    for payment in debt['payments']:
+        balance -= payment['amount']
+        payment['balance'] = balance
+    return debt
+
+async def customer_statement(customer_id: str, limit: int, after: Optional[str]):
+    customer = await db.customers.find_one({"id": customer_id}, CUSTOMER_PROJECTION)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    debts = await db.debts.aggregate(statement_pipeline(customer_id, limit, after)).to_list(limit + 1)
+    next_cursor = None
+    if len(debts) > limit:
+        debts = debts[:limit]
+        next_cursor = encode_cursor(debts[-1], "created_at")
+    return {"customer": customer, "debts": [add_running_balances(debt) for debt in debts], "next_cursor": next_cursor}
+
+# ============= INDEXES =============
+# Indexes required by the route queries, declared per collection. Creation is
+# idempotent, so this runs on every startup.
+
+REQUIRED_INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "customers": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("search_tokens", ASCENDING)]),
+        IndexModel([("name", ASCENDING)]),
+        IndexModel([("total_debt", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("total_paid", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "debts": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("due_date", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("customer_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "installments": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("debt_id", ASCENDING), ("installment_number", ASCENDING)]),
+        IndexModel([("paid", ASCENDING), ("due_date", ASCENDING)]),
+        IndexModel([("payment_id", ASCENDING)]),
+    ],
+    "payments": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("payment_date", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("customer_id", ASCENDING), ("payment_date", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("debt_id", ASCENDING)]),
+    ],
+    "reconciliation_runs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("started_at", ASCENDING)]),
+    ],
+    "reconciliation_discrepancies": [
+        IndexModel([("run_id", ASCENDING), ("debt_id", ASCENDING), ("id", ASCENDING)]),
+    ],
+}
+
+# (route, collection, filter, sort) for each query the routes issue
+ROUTE_QUERY_SHAPES = [
+    ("register", "users", {"username": ""}, None),
+    ("register", "users", {"email": ""}, None),
+    ("login", "users", {"username": ""}, None),
+    ("get_customers", "customers", {}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("get_customers", "customers", {}, [("total_debt", DESCENDING), ("id", DESCENDING)]),
+    ("get_customers", "customers", {}, [("total_paid", DESCENDING), ("id", DESCENDING)]),
+    ("get_customers", "customers", {"search_tokens": {"$all": ["juan"]}}, None),
+    ("create_debt", "customers", {"name": {"$in": [""]}}, None),
+    ("get_customer", "customers", {"id": ""}, None),
+    ("get_customer_statement", "debts", {"customer_id": ""}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("get_customer_statement", "installments", {"debt_id": ""}, None),
+    ("get_customer_statement", "payments", {"debt_id": ""}, None),
+    ("get_debts", "debts", {}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("get_debts", "debts", {"status": "pending"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("get_debts", "debts", {"status": {"$in": analytics.OPEN_STATUSES}}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("get_debts", "debts", {"customer_id": ""}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("get_overdue_debts", "debts", {"due_date": {"$lt": ""}, "status": {"$in": ["pending", "partial", "overdue"]}}, None),
+    ("get_debt", "debts", {"id": ""}, None),
+    ("get_debt_installments", "installments", {"debt_id": ""}, [("installment_number", ASCENDING), ("id", ASCENDING)]),
+    ("pay_installment", "installments", {"id": ""}, None),
+    ("get_aging_report", "installments", {"paid": False}, None),
+    ("get_aging_report", "debts", {"status": {"$in": analytics.OPEN_STATUSES}}, None),
+    ("get_payments", "payments", {}, [("payment_date", DESCENDING), ("id", DESCENDING)]),
+    ("get_payments", "payments", {"customer_id": ""}, [("payment_date", DESCENDING), ("id", DESCENDING)]),
+    ("delete_payment", "payments", {"id": ""}, None),
+    ("delete_payment", "installments", {"payment_id": ""}, None),
+    ("collect_orphans", "installments", {"debt_id": {"$gt": ""}}, [("debt_id", ASCENDING)]),
+    ("collect_orphans", "payments", {"debt_id": {"$gt": ""}}, [("debt_id", ASCENDING)]),
+]
+
+async def ensure_indexes():
+    """Create the declared indexes; existing identical indexes are left alone"""
+    created = {}
+    for collection, indexes in REQUIRED_INDEXES.items():
+        try:
+            created[collection] = await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # Conflicting options or duplicate keys: keep serving, but say so
+            logger.error("Could not create indexes on %s: %s", collection, e)
+    return created
+
+def plan_stages(plan):
+    """Collect the stage names of an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+async def explain_route_queries():
+    """Explain every route query shape and flag the ones that scan a collection"""
+    report = []
+    for route, collection, query, sort in ROUTE_QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = plan_stages(explanation.get('queryPlanner', {}).get('winningPlan', {}))
+        diagnostic = IndexDiagnostic(
+            route=route,
+            collection=collection,
+            stages=stages,
+            collscan='COLLSCAN' in stages
+        )
+        if diagnostic.collscan:
+            logger.warning("COLLSCAN in %s on %s for %s", route, collection, query)
+        report.append(diagnostic)
+    return report
+
+# ============= PAYMENT APPLICATION =============
+# Debt balances change through a single conditional pipeline update, so the
+# new status is computed by the server from the updated amounts and concurrent
+# payments can never overwrite each other.
+
+PAYMENT_EPSILON = 0.01
+
+def payment_pipeline(amount: float):
+    """Update pipeline adding a payment to a debt and recomputing its status"""
+    return [
+        {"$set": {
+            "paid_amount": {"$add": ["$paid_amount", amount]},
+            "remaining_amount": {"$subtract": ["$remaining_amount", amount]}
+        }},
+        {"$set": {
+            "status": {"$cond": [{"$lte": ["$remaining_amount", PAYMENT_EPSILON]}, "paid", "partial"]}
+        }}
+    ]
+
+async def apply_payment_to_debt(debt_id: str, amount: float, check_remaining: bool = True, session=None):
+    """Atomically add a payment to a debt; returns the updated debt or None if it did not match"""
+    query = {"id": debt_id}
+    if check_remaining:
+        query["status"] = {"$ne": "paid"}
+        query["remaining_amount"] = {"$gte": amount}
+    return await db.debts.find_one_and_update(
+        query,
+        payment_pipeline(amount),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+
+async def payment_rejection(debt_id: str) -> HTTPException:
+    """Explain why apply_payment_to_debt did not match the debt"""
+    debt = await db.debts.find_one({"id": debt_id}, {"_id": 0, "status": 1})
+    if not debt:
+        return HTTPException(status_code=404, detail="Deuda no encontrada")
+    if debt['status'] == 'paid':
+        return HTTPException(status_code=400, detail="Esta deuda ya está pagada")
+    return HTTPException(status_code=400, detail="El monto excede la deuda pendiente")
+
+def installment_order(installment: dict):
+    """Oldest first; installments without a due date go last, as in analytics"""
+    due_date = installment.get('due_date')
+    return (due_date is None, due_date or datetime.min, installment['installment_number'])
+
+async def installment_dues(debt_ids, session=None):
+    """The debts by id, and their unpaid installments oldest first, each with what is still owed on it
+
+    Payments made outside the schedule cover a debt's oldest unpaid installments
+    first, so the newest ones are owed in full and the dues of a debt never add
+    up to more than its `remaining_amount`.
+    """
+    debts = {
+        debt['id']: debt
+        async for debt in db.debts.find(
+            {"id": {"$in": list(debt_ids)}},
+            {"_id": 0, "id": 1, "customer_id": 1, "customer_name": 1, "remaining_amount": 1},
+            session=session
+        )
+    }
+    installments = await db.installments.find(
+        {"debt_id": {"$in": list(debts)}, "paid": False}, {"_id": 0}, session=session
+    ).to_list(None)
+    installments.sort(key=lambda installment: (installment['debt_id'], installment_order(installment)))
+    dues = []
+    left = {debt_id: max(debt.get('remaining_amount') or 0, 0) for debt_id, debt in debts.items()}
+    for installment in reversed(installments):
+        due = min(installment['amount'], left[installment['debt_id']])
+        left[installment['debt_id']] -= due
+        dues.append((installment, due))
+    return debts, dues[::-1]
+
+async def release_installments(payment_ids: Dict[str, str], session=None):
+    """Undo installment claims, given the payment id each was claimed for"""
+    if payment_ids:
+        await db.installments.bulk_write([
+            UpdateOne(
+                {"id": installment_id, "payment_id": payment_id},
+                {"$set": {"paid": False, "payment_date": None, "payment_id": None}}
+            )
+            for installment_id, payment_id in payment_ids.items()
+        ], ordered=False, session=session)
+
+async def revert_payment_from_debt(debt_id: str, amount: float, session=None):
+    """Atomically take a deleted payment back out of a debt"""
+    return await db.debts.find_one_and_update(
+        {"id": debt_id},
+        [
+            {"$set": {
+                "paid_amount": {"$subtract": ["$paid_amount", amount]},
+                "remaining_amount": {"$add": ["$remaining_amount", amount]}
+            }},
+            {"$set": {
+                "status": {"$switch": {
+                    "branches": [
+                        {"case": {"$lte": ["$paid_amount", PAYMENT_EPSILON]}, "then": "pending"},
+                        {"case": {"$gt": ["$remaining_amount", PAYMENT_EPSILON]}, "then": "partial"}
+                    ],
+                    "default": "paid"
+                }}
+            }}
+        ],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+
+# ============= CASCADE DELETION =============
+# Installments and payments belong to a debt and go away with it. Removed
+# documents are copied to archived_<collection> (with archived_at) before the
+# delete, inside the caller's unit of work. The orphan collector cleans up
+# children left behind by deletes made before the cascade existed.
+
+DEBT_CHILDREN = ["installments", "payments"]
+
+async def remove_documents(collection: str, query: dict, session=None) -> int:
+    """Delete matching documents, archiving them first when ARCHIVE_DELETED is on"""
+    if ARCHIVE_DELETED:
+        docs = await db[collection].find(query, session=session).to_list(None)
+        if not docs:
+            return 0
+        archived_at = datetime.now(timezone.utc)
+        # Upserts keep a retried archive from failing on duplicates
+        await db[f"archived_{collection}"].bulk_write([
+            ReplaceOne({"_id": doc['_id']}, {**doc, "archived_at": archived_at}, upsert=True)
+            for doc in docs
+        ], ordered=False, session=session)
+        query = {"_id": {"$in": [doc['_id'] for doc in docs]}}
+    result = await db[collection].delete_many(query, session=session)
+    return result.deleted_count
+
+async def remove_debts(query: dict, session=None) -> List[dict]:
+    """Remove matching debts with their installments and payments; returns the removed debts"""
+    debts = await db.debts.find(
+        query,
+        {"_id": 0, "id": 1, "customer_id": 1, "customer_name": 1, "paid_amount": 1, "remaining_amount": 1, "created_at": 1},
+        session=session
+    ).to_list(None)
+    if not debts:
+        return []
+    debt_ids = [debt['id'] for debt in debts]
+    payment_days = [
+        row['_id'] async for row in db.payments.aggregate(rollups.payment_days_pipeline(debt_ids), session=session)
+    ]
+    await rollups.mark_stale(
+        db, [*rollups.day_keys(debt.get('created_at') for debt in debts), *filter(None, payment_days)], session=session
+    )
+    for collection in DEBT_CHILDREN:
+        await remove_documents(collection, {"debt_id": {"$in": debt_ids}}, session=session)
+    await remove_documents("debts", {"id": {"$in": debt_ids}}, session=session)
+    await apply_customer_balances(
+        ((debt.get('customer_id'), -debt['remaining_amount'], -debt['paid_amount']) for debt in debts),
+        session=session
+    )
+    await apply_dashboard_delta(
+        remaining=-sum(debt['remaining_amount'] for debt in debts),
+        paid=-sum(debt['paid_amount'] for debt in debts),
+        debts=-len(debts),
+        session=session
+    )
+    for name, count in Counter(debt['customer_name'] for debt in debts).items():
+        await track_customer_debts(name, -count, session=session)
+    return debts
+
+async def apply_removed_debts(debts: List[dict]):
+    """Refresh cached reads after removing debts; call after the commit"""
+    if debts:
+        await mark_changed("debts", "customers", *DEBT_CHILDREN)
+
+async def orphan_debt_ids(collection: str, after: Optional[str], limit: int):
+    """(orphaned debt_ids, last debt_id seen) for the next `limit` children after `after`"""
+    # A bounded walk of the debt_id index; each batch costs O(limit), not O(remaining)
+    query = {"debt_id": {"$gt": after}} if after else {}
+    rows = await db[collection].find(query, {"_id": 0, "debt_id": 1}) \
+        .sort("debt_id", 1) \
+        .limit(limit) \
+        .to_list(limit)
+    if not rows:
+        return [], None
+    debt_ids = sorted({row['debt_id'] for row in rows})
+    existing = {
+        debt['id'] async for debt in db.debts.find({"id": {"$in": debt_ids}}, {"_id": 0, "id": 1})
+    }
+    return [debt_id for debt_id in debt_ids if debt_id not in existing], rows[-1]['debt_id']
+
+async def collect_orphans():
+    """Remove installments and payments whose debt no longer exists, in batches"""
+    removed = {}
+    for collection in DEBT_CHILDREN:
+        removed[collection] = 0
+        after = None
+        while True:
+            # All children of the last debt_id seen are handled with it, so the walk skips past them
+            orphan_ids, after = await orphan_debt_ids(collection, after, ORPHAN_GC_BATCH_SIZE)
+            if after is None:
+                break
+            if orphan_ids:
+                removed[collection] += await remove_documents(collection, {"debt_id": {"$in": orphan_ids}})
+        if removed[collection]:
+            logger.info("Removed %d orphaned %s", removed[collection], collection)
+    if any(removed.values()):
+        await mark_changed(*[collection for collection, count in removed.items() if count])
+    return OrphanCollectionResult(**removed, collected_at=datetime.now(timezone.utc))
+
+async def run_orphan_collector():
+    while True:
+        try:
+            await collect_orphans()
+        except Exception:
+            logger.exception("Orphan collection failed")
+        await asyncio.sleep(ORPHAN_GC_INTERVAL_SECONDS)
+
+# ============= OVERDUE SWEEPER =============
+# Debts past their due date are flagged by one update_many, on a schedule and
+# on demand, so the read endpoints never write.
+
+async def sweep_overdue_debts():
+    now = datetime.now(timezone.utc)
+    result = await db.debts.update_many(
+        {"due_date": {"$lt": now}, "status": {"$in": ["pending", "partial"]}},
+        {"$set": {"status": "overdue"}}
+    )
+    if result.modified_count:
+        logger.info("Marked %d debts as overdue", result.modified_count)
+        await mark_changed("debts")
+    return OverdueSweepResult(swept=result.modified_count, swept_at=now)
+
+async def run_overdue_sweeper():
+    while True:
+        try:
+            await sweep_overdue_debts()
+        except Exception:
+            logger.exception("Overdue sweep failed")
+        await asyncio.sleep(OVERDUE_SWEEP_INTERVAL_SECONDS)
+
+# ============= DAILY ROLLUPS =============
+# Trend reports read the per-day documents kept by rollups.py. The job runs on
+# a schedule; writes that change a past day (payment deletes, backdated
+# payment imports, debt removal) mark that day stale inside their own writes.
+
+async def roll_up_days():
+    result = await rollups.run_rollups(db)
+    if result.days_computed:
+        logger.info("Rolled up %d days", len(result.days_computed))
+        await mark_changed("daily_rollups")
+    return result
+
+async def run_rollup_job():
+    while True:
+        try:
+            await roll_up_days()
+        except Exception:
+            logger.exception("Daily rollup failed")
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+
+# ============= LIVE EVENTS =============
+# Changes to debts, payments and installments are pushed to connected clients
+# over /api/events. On a replica set the feed is a change stream, so writes from
+# every worker are seen with the changed document. A standalone mongod has no
+# change streams; there the collection version counters are polled and clients
+# are told which collection to refetch.
+#
+# Events: insert/update carry the document, invalidate names a collection to
+# reload (deletes, polled changes) and resync means the client fell behind.
+
+class EventBus:
+    """Fans events out to subscriber queues; a full queue is collapsed to a resync"""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event: Dict[str, Any]):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A slow client gets one resync instead of an unbounded backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+
+event_bus = EventBus(EVENT_QUEUE_SIZE)
+
+def change_event(change) -> Dict[str, Any]:
+    collection = change['ns']['coll']
+    doc = change.get('fullDocument')
+    if change['operationType'] == 'delete' or doc is None:
+        return {"type": "invalidate", "collection": collection}
+    doc = {key: value for key, value in doc.items() if key not in ("_id", *SEARCH_FIELDS)}
+    event_type = "insert" if change['operationType'] == 'insert' else "update"
+    return {"type": event_type, "collection": collection, "id": doc.get('id'), "doc": doc}
+
+async def watch_changes():
+    """Publish change stream events, resuming after the last one seen on errors"""
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": EVENT_COLLECTIONS},
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+    }}]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    event_bus.publish(change_event(change))
+        except PyMongoError:
+            logger.exception("Change stream failed; resuming")
+            event_bus.publish({"type": "resync"})
+            await asyncio.sleep(EVENT_POLL_INTERVAL_SECONDS)
+
+async def poll_changes():
+    """Standalone fallback: publish an invalidate when a collection version moves"""
+    versions = None
+    while True:
+        try:
+            if event_bus.subscribers:
+                docs = await db.collection_versions.find({"_id": {"$in": EVENT_COLLECTIONS}}).to_list(None)
+                current = {doc['_id']: doc['version'] for doc in docs}
+                if versions is not None:
+                    for collection in EVENT_COLLECTIONS:
+                        if current.get(collection) != versions.get(collection):
+                            event_bus.publish({"type": "invalidate", "collection": collection})
+                versions = current
+        except PyMongoError:
+            logger.exception("Polling collection versions failed")
+        await asyncio.sleep(EVENT_POLL_INTERVAL_SECONDS)
+
+async def run_event_feed():
+    # Change streams need a replica set or sharded cluster, same as transactions
+    if await supports_transactions():
+        logger.info("Live events fed by change streams")
+        await watch_changes()
+    else:
+        logger.info("Live events fed by polling every %.1fs", EVENT_POLL_INTERVAL_SECONDS)
+        await poll_changes()
+
+# ============= BULK IMPORT =============
+# Uploads are read from the request body as a stream of NDJSON or CSV rows.
+# Rows are validated one by one and written in chunks of IMPORT_CHUNK_SIZE with
+# unordered bulk inserts, so a bad row only fails itself. The report lists the
+# failing rows by their 1-based position in the upload (CSV header excluded).
+
+def decode_line(line: bytes) -> str:
+    try:
+        # utf-8-sig drops the byte order mark spreadsheet exports start with
+        return line.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8")
+
+async def iter_body_lines(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield decode_line(line) + "\n"
+    if buffer:
+        yield decode_line(buffer)
+
+def in_quoted_field(line: str, quoted: bool = False) -> bool:
+    """Whether a CSV record is still inside a quoted field after this line.
+
+    Follows the csv module: a quote only opens a field at its start, and
+    quotes inside unquoted cells are literal.
+    """
+    state = "quoted" if quoted else "start"
+    for ch in line:
+        if state == "quoted":
+            if ch == '"':
+                state = "quote"
+        elif state == "quote":
+            state = "quoted" if ch == '"' else "start" if ch == "," else "field"
+        elif ch == ",":
+            state = "start"
+        elif state == "start" and ch == '"':
+            state = "quoted"
+        else:
+            state = "field"
+    return state == "quoted"
+
+def parse_csv_record(record: str):
+    try:
+        return next(csv.reader([record]), []), None
+    except csv.Error as e:
+        return None, f"CSV inválido: {e}"
+
+async def iter_csv_records(request: Request):
+    """Yield (values, error) per record; a record spans lines only inside a quoted field"""
+    record = ""
+    quoted = False
+    async for line in iter_body_lines(request):
+        if len(record) + len(line) > IMPORT_MAX_RECORD_CHARS:
+            # Most likely an unclosed quote; give up on the record and resume at this line
+            yield None, "Registro demasiado largo (¿comillas sin cerrar?)"
+            record, quoted = "", False
+        record += line
+        quoted = in_quoted_field(line, quoted)
+        if not quoted:
+            yield parse_csv_record(record)
+            record = ""
+    if record:
+        yield parse_csv_record(record)
+
+async def iter_import_rows(request: Request, import_format: str):
+    """Yield (row, fields, error) for every non-blank row of the upload"""
+    row = 0
+    if import_format == "csv":
+        header = None
+        async for values, error in iter_csv_records(request):
+            if values is not None and not any(value.strip() for value in values):
+                continue
+            if header is None:
+                if error:
+                    raise HTTPException(status_code=400, detail=f"Encabezado inválido: {error}")
+                header = [name.strip() for name in values]
+                continue
+            row += 1
+            if error:
+                yield row, None, error
+            elif len(values) != len(header):
+                yield row, None, f"Se esperaban {len(header)} columnas, hay {len(values)}"
+            else:
+                # Empty cells mean "not given", so model defaults apply
+                yield row, {name: value for name, value in zip(header, values) if value != ""}, None
+        return
+    
+    async for line in iter_body_lines(request):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            yield row, None, "JSON inválido"
+            continue
+        if isinstance(fields, dict):
+            yield row, fields, None
+        else:
+            yield row, None, "Se esperaba un objeto JSON"
+
+def validation_message(error: ValidationError):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+async def insert_rows(collection: str, rows: List[int], docs: List[dict]) -> Dict[int, str]:
+    """Unordered insert_many; returns the rows whose documents were rejected"""
+    try:
+        await db[collection].insert_many(docs, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        return {
+            rows[error['index']]: "ID duplicado" if error['code'] == 11000 else error['errmsg']
+            for error in e.details['writeErrors']
+        }
+
+async def import_customers(chunk) -> Dict[int, str]:
+    docs = [customer_document(Customer(**data.model_dump(exclude_none=True))) for _, data in chunk]
+    failed = await insert_rows("customers", [row for row, _ in chunk], docs)
+    await mark_changed("customers")
+    return failed
+
+async def import_debts(chunk) -> Dict[int, str]:
+    given_ids = {data.customer_id for _, data in chunk if data.customer_id}
+    customers = {
+        customer['id']: customer['name']
+        async for customer in db.customers.find({"id": {"$in": list(given_ids)}}, {"_id": 0, "id": 1, "name": 1})
+    } if given_ids else {}
+    names = await customers_by_name({data.customer_name for _, data in chunk if not data.customer_id})
+    
+    prepared = []
+    invalid = {}
+    for row, data in chunk:
+        if data.customer_id:
+            if data.customer_id not in customers:
+                invalid[row] = "customer_id: Cliente no encontrado"
+                continue
+            data.customer_name = customers[data.customer_id]
+        else:
+            data.customer_id = names.get(data.customer_name)
+        fields = data.model_dump(include={"id"}, exclude_none=True)
+        try:
+            prepared.append((row, *prepare_debt(data, **fields)))
+        except ValueError:
+            invalid[row] = "due_date: fecha inválida"
+    
+    async def work(uow):
+        # Debts, installments and every total they move commit together
+        existing = {
+            doc['id'] async for doc in db.debts.find(
+                {"id": {"$in": [debt.id for _, debt, _ in prepared]}}, {"_id": 0, "id": 1}, session=uow.session
+            )
+        }
+        failed = {}
+        inserted = []
+        for row, debt, schedule in prepared:
+            if debt.id in existing:
+                failed[row] = "ID duplicado"
+                continue
+            existing.add(debt.id)
+            inserted.append((debt, schedule))
+        if inserted:
+            await db.debts.insert_many([debt.model_dump() for debt, _ in inserted], session=uow.session)
+            installment_docs = [doc for _, schedule in inserted for doc in schedule]
+            if installment_docs:
+                await db.installments.insert_many(installment_docs, session=uow.session)
+            await apply_customer_balances(
+                ((debt.customer_id, debt.remaining_amount, 0.0) for debt, _ in inserted), session=uow.session
+            )
+            await apply_dashboard_delta(
+                remaining=sum(debt.remaining_amount for debt, _ in inserted), debts=len(inserted), session=uow.session
+            )
+            await add_customer_debts(Counter(debt.customer_name for debt, _ in inserted), session=uow.session)
+        return failed
+    
+    failed = {}
+    if prepared:
+        try:
+            failed = await UnitOfWork.run(work)
+        except BulkWriteError:
+            # An id was taken by a concurrent import; the rerun reports it as a duplicate
+            failed = await UnitOfWork.run(work)
+    await mark_changed("debts", "installments", "customers")
+    return {**invalid, **failed}
+
+async def import_payments(chunk) -> Dict[int, str]:
+    # Payments to the same debt are applied in upload order, in one unit of work
+    # per debt so its amounts never move without the payment records behind
+    # them; different debts run concurrently
+    by_debt = {}
+    for row, data in chunk:
+        by_debt.setdefault(data.debt_id, []).append((row, data))
+    
+    failed = {}
+    payment_docs = []
+    
+    async def apply(rows):
+        async def work(uow):
+            rejected = {}
+            docs = []
+            for row, data in rows:
+                debt = await apply_payment_to_debt(data.debt_id, data.amount, session=uow.session)
+                if not debt:
+                    rejected[row] = (await payment_rejection(data.debt_id)).detail
+                    continue
+                payment = Payment(
+                    debt_id=data.debt_id,
+                    customer_id=debt.get('customer_id', ''),
+                    customer_name=debt['customer_name'],
+                    **data.model_dump(exclude={"debt_id"}, exclude_none=True)
+                )
+                docs.append(payment.model_dump())
+            if docs:
+                await db.payments.insert_many(docs, session=uow.session)
+                await apply_customer_balances(
+                    ((doc['customer_id'], -doc['amount'], doc['amount']) for doc in docs), session=uow.session
+                )
+                paid = sum(doc['amount'] for doc in docs)
+                await apply_dashboard_delta(remaining=-paid, paid=paid, session=uow.session)
+            return rejected, docs
+        
+        try:
+            rejected, docs = await UnitOfWork.run(work)
+        except PyMongoError as e:
+            logger.warning("Payment import failed for debt %s: %s", rows[0][1].debt_id, e)
+            rejected, docs = {row: "No se pudo registrar el pago" for row, _ in rows}, []
+        failed.update(rejected)
+        payment_docs.extend(docs)
+    
+    await asyncio.gather(*(apply(rows) for rows in by_debt.values()))
+    if payment_docs:
+        # Rows with their own payment_date may land on days already rolled up
+        today = datetime.now(timezone.utc).date().isoformat()
+        await rollups.mark_stale(db, [
+            day for day in rollups.day_keys(doc['payment_date'] for doc in payment_docs) if day < today
+        ])
+    await mark_changed("debts", "payments", "customers")
+    return failed
+
+IMPORTERS = {
+    "customers": (CustomerImport, import_customers),
+    "debts": (DebtImport, import_debts),
+    "payments": (PaymentImport, import_payments),
+}
+
+async def run_import(request: Request, collection: str, import_format: str) -> ImportReport:
+    model, write_chunk = IMPORTERS[collection]
+    report = ImportReport(collection=collection)
+    
+    def fail(row, error):
+        report.failed += 1
+        if len(report.errors) < IMPORT_MAX_ERRORS:
+            report.errors.append(ImportRowError(row=row, error=error))
+    
+    async def flush(chunk):
+        failed = await write_chunk(chunk)
+        report.inserted += len(chunk) - len(failed)
+        for row, error in sorted(failed.items()):
+            fail(row, error)
+    
+    chunk = []
+    async for row, fields, error in iter_import_rows(request, import_format):
+        report.received += 1
+        if error is None:
+            try:
+                chunk.append((row, model.model_validate(fields)))
+            except ValidationError as e:
+                error = validation_message(e)
+        if error is not None:
+            fail(row, error)
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await flush(chunk)
+            chunk = []
+    if chunk:
+        await flush(chunk)
+    
+    report.errors.sort(key=lambda error: error.row)
+    return report
+
 # ============= AUTH ROUTES =============
 
 @api_router.post("/auth/register", response_model=Token)
@@ -196,8 +2184,7 @@ async def register(user_data: UserCreate):
     # Create user
     user = User(username=user_data.username, email=user_data.email)
     user_dict = user.model_dump()
-    user_dict['password_hash'] = get_password_hash(user_data.password)
-    user_dict = serialize_doc(user_dict)
+    user_dict['password_hash'] = await password_pool.run(get_password_hash, user_data.password)
     
     await db.users.insert_one(user_dict)
     
@@ -214,10 +2201,9 @@ async def login(user_data: UserLogin):
         raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
     
     # Verify password
-    if not verify_password(user_data.password, user_doc['password_hash']):
+    if not await password_pool.run(verify_password, user_data.password, user_doc['password_hash']):
         raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
     
-    deserialize_doc(user_doc)
     user = User(**user_doc)
     
     # Create token
@@ -225,37 +2211,85 @@ async def login(user_data: UserLogin):
     
     return Token(access_token=access_token, token_type="bearer", user=user)
 
+@api_router.get("/metrics/password-hashing", response_model=PasswordPoolMetrics)
+async def get_password_hashing_metrics():
+    return password_pool.metrics()
+
 # ============= CUSTOMER ROUTES =============
 
 @api_router.post("/customers", response_model=Customer)
 async def create_customer(customer_data: CustomerCreate):
     customer = Customer(**customer_data.model_dump())
-    doc = serialize_doc(customer.model_dump())
-    await db.customers.insert_one(doc)
+    await db.customers.insert_one(customer_document(customer))
+    await mark_changed("customers")
     return customer
 
-@api_router.get("/customers", response_model=List[Customer])
-async def get_customers(search: Optional[str] = None):
-    query = {}
-    if search:
-        query = {"$or": [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"phone": {"$regex": search, "$options": "i"}}
-        ]}
+@api_router.post("/customers/import", response_model=ImportReport)
+async def import_customers_route(
+    request: Request,
+    import_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    return await run_import(request, "customers", import_format)
+
+@api_router.get("/customers", response_model=Page[Customer])
+async def get_customers(
+    request: Request,
+    search: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: str = Query("created_at", pattern=f"^({'|'.join(BALANCE_SORT_FIELDS)})$"),
+    fields: Optional[str] = None
+):
+    # Paging needs the sort field
+    selected = parse_fields(fields, Customer, sort)
+    projection = fields_projection(selected) if selected else CUSTOMER_PROJECTION
+    
+    tokens = search_query_tokens(search) if search else []
+    if tokens and len(''.join(tokens)) < SEARCH_MIN_QUERY_CHARS:
+        raise HTTPException(
+            status_code=400, detail=f"La búsqueda requiere al menos {SEARCH_MIN_QUERY_CHARS} caracteres"
+        )
+    
+    async def load():
+        if tokens:
+            customers = await db.customers.aggregate(
+                search_pipeline(search, tokens, limit, after, projection)
+            ).to_list(limit + 1)
+            next_cursor = encode_cursor(customers[limit - 1], "search_key") if len(customers) > limit else None
+            customers = customers[:limit]
+            for customer in customers:
+                customer.pop('search_key', None)
+        else:
+            customers, next_cursor = await paginate(
+                db.customers, {}, sort, -1, limit, after, projection=projection
+            )
+        return model_json(Page[sparse_model(Customer, selected)], {"items": customers, "next_cursor": next_cursor})
     
-    customers = await db.customers.find(query, {"_id": 0}).to_list(1000)
-    for customer in customers:
-        deserialize_doc(customer)
-    return customers
+    return await conditional_json(request, "customers", ("list", search, limit, after, sort, selected), load)
 
 @api_router.get("/customers/{customer_id}", response_model=Customer)
 async def get_customer(customer_id: str):
-    customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
+    # Not cached: a lookup by the indexed id costs no more than the version
+    # check a cached copy would need to stay current across workers
+    customer = await db.customers.find_one({"id": customer_id}, CUSTOMER_PROJECTION)
     if not customer:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
-    deserialize_doc(customer)
     return customer
 
+@api_router.get("/customers/{customer_id}/statement", response_model=CustomerStatement)
+async def get_customer_statement(
+    request: Request,
+    customer_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None
+):
+    async def load():
+        return model_json(CustomerStatement, await customer_statement(customer_id, limit, after))
+    
+    return await conditional_json(
+        request, "customers", ("statement", customer_id, limit, after), load, depends=STATEMENT_DEPENDS
+    )
+
 @api_router.put("/customers/{customer_id}", response_model=Customer)
 async def update_customer(customer_id: str, customer_data: CustomerUpdate):
     update_data = {k: v for k, v in customer_data.model_dump().items() if v is not None}
@@ -263,6 +2297,15 @@ async def update_customer(customer_id: str, customer_data: CustomerUpdate):
     if not update_data:
         raise HTTPException(status_code=400, detail="No hay datos para actualizar")
     
+    if 'name' in update_data or 'phone' in update_data:
+        current = await db.customers.find_one({"id": customer_id}, {"_id": 0, "name": 1, "phone": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        update_data.update(customer_search_fields(
+            update_data.get('name', current.get('name')),
+            update_data.get('phone', current.get('phone'))
+        ))
+    
     result = await db.customers.update_one(
         {"id": customer_id},
         {"$set": update_data}
@@ -270,332 +2313,616 @@ async def update_customer(customer_id: str, customer_data: CustomerUpdate):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    await mark_changed("customers")
     
-    customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
-    deserialize_doc(customer)
+    customer = await db.customers.find_one({"id": customer_id}, CUSTOMER_PROJECTION)
     return customer
 
 @api_router.delete("/customers/{customer_id}")
 async def delete_customer(customer_id: str):
-    result = await db.customers.delete_one({"id": customer_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    async def work(uow):
+        if not await remove_documents("customers", {"id": customer_id}, session=uow.session):
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        return await remove_debts({"customer_id": customer_id}, session=uow.session)
+    
+    debts = await UnitOfWork.run(work)
+    await apply_removed_debts(debts)
+    await mark_changed("customers")
     return {"message": "Cliente eliminado"}
 
 @api_router.delete("/customers/{customer_id}/paid-debts")
 async def delete_paid_debts_for_customer(customer_id: str):
-    # Delete all paid debts for this customer
-    result = await db.debts.delete_many({
-        "customer_id": customer_id,
-        "status": "paid"
-    })
+    # Delete all paid debts for this customer, with their installments and payments
+    paid_debts = await UnitOfWork.run(
+        lambda uow: remove_debts({"customer_id": customer_id, "status": "paid"}, session=uow.session)
+    )
+    await apply_removed_debts(paid_debts)
     
     return {
-        "message": f"{result.deleted_count} deudas pagadas eliminadas",
-        "deleted_count": result.deleted_count
+        "message": f"{len(paid_debts)} deudas pagadas eliminadas",
+        "deleted_count": len(paid_debts)
     }
 
 # ============= DEBT ROUTES =============
 
 @api_router.post("/debts", response_model=Debt)
 async def create_debt(debt_data: DebtCreate):
-    due_date = None
-    if debt_data.due_date:
-        due_date = datetime.fromisoformat(debt_data.due_date)
+    await resolve_debt_customer(debt_data)
+    debt, installment_docs = prepare_debt(debt_data)
+    doc = debt.model_dump()
     
-    # Calcular el valor de cada parcela
-    installment_amount = debt_data.total_amount / debt_data.num_installments
+    # Crear las parcelas en un solo lote, junto con la deuda
+    async def work(uow):
+        await db.debts.insert_one(doc, session=uow.session)
+        if installment_docs:
+            await db.installments.insert_many(installment_docs, session=uow.session)
+        await apply_customer_balances([(debt.customer_id, debt.remaining_amount, 0.0)], session=uow.session)
+        await apply_dashboard_delta(remaining=debt.remaining_amount, debts=1, session=uow.session)
+        await track_customer_debts(debt.customer_name, 1, session=uow.session)
+    await UnitOfWork.run(work)
     
-    debt = Debt(
-        customer_name=debt_data.customer_name,
-        description=debt_data.description,
-        product_type=debt_data.product_type,
-        installment_type=debt_data.installment_type,
-        num_installments=debt_data.num_installments,
-        installment_amount=installment_amount,
-        total_amount=debt_data.total_amount,
-        remaining_amount=debt_data.total_amount,
-        due_date=due_date
-    )
-    
-    doc = serialize_doc(debt.model_dump())
-    await db.debts.insert_one(doc)
-    
-    # Crear las parcelas
-    installments = []
-    for i in range(1, debt_data.num_installments + 1):
-        # Calcular fecha de vencimiento de cada parcela
-        installment_due_date = None
-        if due_date:
-            if debt_data.installment_type == "semanal":
-                installment_due_date = due_date + timedelta(weeks=(i-1))
-            elif debt_data.installment_type == "mensual":
-                installment_due_date = due_date + timedelta(days=30*(i-1))
-            else:  # único
-                installment_due_date = due_date
-        
-        installment = Installment(
-            debt_id=debt.id,
-            installment_number=i,
-            amount=installment_amount,
-            due_date=installment_due_date
-        )
-        
-        installment_doc = serialize_doc(installment.model_dump())
-        await db.installments.insert_one(installment_doc)
-        installments.append(installment)
+    await mark_changed("debts", "installments", "customers")
     
     return debt
 
-@api_router.get("/debts", response_model=List[Debt])
-async def get_debts(status: Optional[str] = None, customer_id: Optional[str] = None):
+@api_router.post("/debts/import", response_model=ImportReport)
+async def import_debts_route(
+    request: Request,
+    import_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    return await run_import(request, "debts", import_format)
+
+@api_router.get("/debts", response_model=Page[Debt])
+async def get_debts(
+    request: Request,
+    status: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    # status acepta varios estados separados por comas, p. ej. pending,partial,overdue
+    statuses = tuple(sorted({value.strip() for value in (status or "").split(",") if value.strip()}))
     query = {}
-    if status:
-        query["status"] = status
+    if len(statuses) == 1:
+        query["status"] = statuses[0]
+    elif statuses:
+        query["status"] = {"$in": list(statuses)}
     if customer_id:
         query["customer_id"] = customer_id
+    selected = parse_fields(fields, Debt, "created_at")
     
-    debts = await db.debts.find(query, {"_id": 0}).to_list(1000)
-    
-    # Check for overdue debts
-    now = datetime.now(timezone.utc)
-    for debt in debts:
-        deserialize_doc(debt)
-        if debt.get('due_date') and debt['due_date'] < now and debt['status'] == 'pending':
-            debt['status'] = 'overdue'
-            await db.debts.update_one({"id": debt['id']}, {"$set": {"status": "overdue"}})
+    async def load():
+        debts, next_cursor = await paginate(
+            db.debts, query, "created_at", -1, limit, after, projection=selected and fields_projection(selected)
+        )
+        return model_json(Page[sparse_model(Debt, selected)], {"items": debts, "next_cursor": next_cursor})
     
-    return debts
+    return await conditional_json(request, "debts", ("list", statuses, customer_id, limit, after, selected), load)
 
 @api_router.get("/debts/overdue", response_model=List[Debt])
-async def get_overdue_debts():
-    now = datetime.now(timezone.utc).isoformat()
-    debts = await db.debts.find({
-        "due_date": {"$lt": now},
-        "status": {"$in": ["pending", "partial", "overdue"]}
-    }, {"_id": 0}).to_list(1000)
-    
-    for debt in debts:
-        deserialize_doc(debt)
-        if debt['status'] != 'overdue':
-            await db.debts.update_one({"id": debt['id']}, {"$set": {"status": "overdue"}})
+async def get_overdue_debts(request: Request):
+    async def load():
+        now = datetime.now(timezone.utc)
+        debts = await db.debts.find({
+            "due_date": {"$lt": now},
+            "status": {"$in": ["pending", "partial", "overdue"]}
+        }, {"_id": 0}).to_list(1000)
+        
+        for debt in debts:
+            # Past due by definition, even if the sweeper has not flagged it yet
             debt['status'] = 'overdue'
+        return model_json(List[Debt], debts)
     
-    return debts
+    return await conditional_json(request, "debts", ("overdue",), load, period=OVERDUE_COUNT_TTL_SECONDS)
+
+@api_router.post("/debts/overdue/sweep", response_model=OverdueSweepResult)
+async def sweep_overdue():
+    return await sweep_overdue_debts()
 
 @api_router.get("/debts/{debt_id}", response_model=Debt)
 async def get_debt(debt_id: str):
+    # Not cached, for the same reason as get_customer
     debt = await db.debts.find_one({"id": debt_id}, {"_id": 0})
     if not debt:
         raise HTTPException(status_code=404, detail="Deuda no encontrada")
-    deserialize_doc(debt)
     return debt
 
-@api_router.get("/debts/{debt_id}/installments", response_model=List[Installment])
-async def get_debt_installments(debt_id: str):
-    installments = await db.installments.find({"debt_id": debt_id}, {"_id": 0}).sort("installment_number", 1).to_list(1000)
-    for inst in installments:
-        deserialize_doc(inst)
-    return installments
+@api_router.get("/debts/{debt_id}/installments", response_model=Page[Installment])
+async def get_debt_installments(
+    request: Request,
+    debt_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    selected = parse_fields(fields, Installment, "installment_number")
+    
+    async def load():
+        installments, next_cursor = await paginate(
+            db.installments, {"debt_id": debt_id}, "installment_number", 1, limit, after,
+            projection=selected and fields_projection(selected)
+        )
+        return model_json(Page[sparse_model(Installment, selected)], {"items": installments, "next_cursor": next_cursor})
+    
+    return await conditional_json(request, "installments", ("list", debt_id, limit, after, selected), load)
 
 @api_router.put("/installments/{installment_id}/pay")
 async def pay_installment(installment_id: str):
-    installment = await db.installments.find_one({"id": installment_id})
-    if not installment:
-        raise HTTPException(status_code=404, detail="Parcela no encontrada")
-    
-    if installment['paid']:
-        raise HTTPException(status_code=400, detail="Esta parcela ya está pagada")
-    
-    # Marcar parcela como pagada
+    # Marcar parcela como pagada; el filtro evita pagarla dos veces
     payment_date = datetime.now(timezone.utc)
-    await db.installments.update_one(
-        {"id": installment_id},
-        {"$set": {
-            "paid": True,
-            "payment_date": payment_date.isoformat()
-        }}
-    )
+    payment_id = str(uuid.uuid4())
     
-    # Actualizar la deuda
-    debt = await db.debts.find_one({"id": installment['debt_id']})
-    if debt:
-        new_paid_amount = debt['paid_amount'] + installment['amount']
-        new_remaining = debt['remaining_amount'] - installment['amount']
-        new_status = 'paid' if new_remaining <= 0.01 else 'partial'
+    async def work(uow):
+        installment = await db.installments.find_one({"id": installment_id}, {"_id": 0}, session=uow.session)
+        if not installment:
+            raise HTTPException(status_code=404, detail="Parcela no encontrada")
+        if installment['paid']:
+            raise HTTPException(status_code=400, detail="Esta parcela ya está pagada")
+        debts, dues = await installment_dues([installment['debt_id']], session=uow.session)
+        if not debts:
+            raise HTTPException(status_code=404, detail="Deuda no encontrada")
+        # Lo ya pagado fuera de las parcelas cubre primero las más antiguas
+        amount = next(due for owed, due in dues if owed['id'] == installment_id)
+        if amount <= PAYMENT_EPSILON:
+            raise HTTPException(status_code=400, detail="Esta parcela ya está cubierta por otros pagos")
         
-        await db.debts.update_one(
-            {"id": installment['debt_id']},
+        claimed = await db.installments.update_one(
+            {"id": installment_id, "paid": False},
             {"$set": {
-                "paid_amount": new_paid_amount,
-                "remaining_amount": new_remaining,
-                "status": new_status
-            }}
+                "paid": True,
+                "payment_date": payment_date,
+                "payment_id": payment_id
+            }},
+            session=uow.session
         )
+        if not claimed.modified_count:
+            raise HTTPException(status_code=400, detail="Esta parcela ya está pagada")
         
-        # Crear registro de pago
-        payment = Payment(
-            debt_id=installment['debt_id'],
-            customer_id=debt.get('customer_id', ''),
-            customer_name=debt['customer_name'],
-            amount=installment['amount'],
-            payment_method='parcela',
-            notes=f"Pago de parcela {installment['installment_number']}",
-            payment_date=payment_date
-        )
+        # Actualizar la deuda; no se cobra más de lo pendiente
+        debt = await apply_payment_to_debt(installment['debt_id'], amount, session=uow.session)
+        if not debt:
+            await release_installments({installment_id: payment_id}, session=uow.session)
+            raise await payment_rejection(installment['debt_id'])
         
-        payment_doc = serialize_doc(payment.model_dump())
-        await db.payments.insert_one(payment_doc)
+        # Crear registro de pago
+        payment = installment_payment(installment, debt, payment_id, payment_date, amount)
+        await db.payments.insert_one(payment.model_dump(), session=uow.session)
+        await apply_customer_balances([(debt.get('customer_id'), -payment.amount, payment.amount)], session=uow.session)
+        await apply_dashboard_delta(remaining=-payment.amount, paid=payment.amount, session=uow.session)
+        return payment
+    
+    payment = await UnitOfWork.run(work)
+    await mark_changed("installments", "debts", "payments", "customers")
     
     return {"message": "Parcela pagada exitosamente"}
 
+@api_router.post("/installments/pay", response_model=InstallmentBatchResult)
+async def pay_installments(batch: InstallmentBatchPay):
+    if batch.installment_ids:
+        query = {"id": {"$in": batch.installment_ids}, "paid": False}
+    elif batch.debt_id and batch.count:
+        query = {"debt_id": batch.debt_id, "paid": False}
+    else:
+        raise HTTPException(status_code=400, detail="Indica installment_ids, o debt_id y count")
+    
+    payment_date = datetime.now(timezone.utc)
+    
+    async def work(uow):
+        if batch.installment_ids:
+            debt_ids = await db.installments.distinct("debt_id", query, session=uow.session)
+        else:
+            debt_ids = [batch.debt_id]
+        debts, dues = await installment_dues(debt_ids, session=uow.session)
+        
+        # Installments already covered by payments made outside the schedule
+        # are skipped, so no debt is charged more than it has pending
+        requested = set(batch.installment_ids)
+        owed = [
+            (installment, due) for installment, due in dues
+            if due > PAYMENT_EPSILON and (not requested or installment['id'] in requested)
+        ]
+        if not requested:
+            owed = owed[:batch.count]
+        due_by_id = {installment['id']: due for installment, due in owed}
+        candidates = [installment for installment, _ in owed]
+        
+        # Claim each installment for its own payment; the paid filter skips
+        # installments another request claimed in the meantime
+        payment_ids = {installment['id']: str(uuid.uuid4()) for installment in candidates}
+        claimed = []
+        if candidates:
+            await db.installments.bulk_write([
+                UpdateOne(
+                    {"id": installment_id, "paid": False},
+                    {"$set": {"paid": True, "payment_date": payment_date, "payment_id": payment_id}}
+                )
+                for installment_id, payment_id in payment_ids.items()
+            ], ordered=False, session=uow.session)
+            owners = {
+                doc['id']: doc.get('payment_id')
+                async for doc in db.installments.find(
+                    {"id": {"$in": list(payment_ids)}}, {"_id": 0, "id": 1, "payment_id": 1}, session=uow.session
+                )
+            }
+            claimed = [
+                installment for installment in candidates
+                if owners.get(installment['id']) == payment_ids[installment['id']]
+            ]
+        
+        # One aggregated update per debt, one insert for all the payments; the
+        # remaining filter rejects a debt paid down since the dues were read
+        totals = {}
+        for installment in claimed:
+            totals[installment['debt_id']] = totals.get(installment['debt_id'], 0) + due_by_id[installment['id']]
+        if totals:
+            result = await db.debts.bulk_write([
+                UpdateOne(
+                    {"id": debt_id, "remaining_amount": {"$gte": total - PAYMENT_EPSILON}},
+                    payment_pipeline(total)
+                )
+                for debt_id, total in totals.items()
+            ], ordered=False, session=uow.session)
+            if result.matched_count < len(totals):
+                await release_installments(
+                    {installment['id']: payment_ids[installment['id']] for installment in claimed}, session=uow.session
+                )
+                raise HTTPException(status_code=409, detail="Las deudas cambiaron durante el pago; inténtalo de nuevo")
+        payments = [
+            installment_payment(
+                installment, debts[installment['debt_id']], payment_ids[installment['id']], payment_date, due_by_id[installment['id']]
+            )
+            for installment in claimed
+        ]
+        if payments:
+            await db.payments.insert_many([payment.model_dump() for payment in payments], session=uow.session)
+        await apply_customer_balances(
+            ((debts[debt_id].get('customer_id'), -total, total) for debt_id, total in totals.items()),
+            session=uow.session
+        )
+        paid = sum(payment.amount for payment in payments)
+        if paid:
+            await apply_dashboard_delta(remaining=-paid, paid=paid, session=uow.session)
+        return claimed, payments
+    
+    claimed, payments = await UnitOfWork.run(work)
+    
+    total_amount = sum(payment.amount for payment in payments)
+    if claimed:
+        await mark_changed("installments", "debts", "payments", "customers")
+    
+    paid_ids = [installment['id'] for installment in claimed]
+    return InstallmentBatchResult(
+        paid=paid_ids,
+        skipped=[installment_id for installment_id in batch.installment_ids if installment_id not in set(paid_ids)],
+        total_amount=total_amount,
+        payments=payments
+    )
+
 @api_router.delete("/debts/{debt_id}")
 async def delete_debt(debt_id: str):
-    debt = await db.debts.find_one({"id": debt_id})
-    if not debt:
+    # La deuda se elimina junto con sus parcelas y pagos
+    debts = await UnitOfWork.run(lambda uow: remove_debts({"id": debt_id}, session=uow.session))
+    if not debts:
         raise HTTPException(status_code=404, detail="Deuda no encontrada")
-    
-    await db.debts.delete_one({"id": debt_id})
+    await apply_removed_debts(debts)
     return {"message": "Deuda eliminada"}
 
 # ============= PAYMENT ROUTES =============
 
 @api_router.post("/payments", response_model=Payment)
 async def create_payment(payment_data: PaymentCreate):
-    # Get debt
-    debt = await db.debts.find_one({"id": payment_data.debt_id})
-    if not debt:
-        raise HTTPException(status_code=404, detail="Deuda no encontrada")
-    
-    if debt['status'] == 'paid':
-        raise HTTPException(status_code=400, detail="Esta deuda ya está pagada")
-    
-    # Verify amount
-    if payment_data.amount > debt['remaining_amount']:
-        raise HTTPException(status_code=400, detail="El monto excede la deuda pendiente")
-    
-    # Create payment
-    payment = Payment(
-        debt_id=payment_data.debt_id,
-        customer_id=debt.get('customer_id', ''),
-        customer_name=debt['customer_name'],
-        amount=payment_data.amount,
-        payment_method=payment_data.payment_method,
-        notes=payment_data.notes
-    )
-    
-    doc = serialize_doc(payment.model_dump())
-    await db.payments.insert_one(doc)
-    
-    # Update debt
-    new_paid_amount = debt['paid_amount'] + payment_data.amount
-    new_remaining = debt['remaining_amount'] - payment_data.amount
-    new_status = 'paid' if new_remaining == 0 else 'partial'
+    async def work(uow):
+        # Apply the payment and check the debt state in one atomic update
+        debt = await apply_payment_to_debt(payment_data.debt_id, payment_data.amount, session=uow.session)
+        if not debt:
+            raise await payment_rejection(payment_data.debt_id)
+        
+        # Create payment
+        payment = Payment(
+            debt_id=payment_data.debt_id,
+            customer_id=debt.get('customer_id', ''),
+            customer_name=debt['customer_name'],
+            amount=payment_data.amount,
+            payment_method=payment_data.payment_method,
+            notes=payment_data.notes
+        )
+        await db.payments.insert_one(payment.model_dump(), session=uow.session)
+        await apply_customer_balances([(debt.get('customer_id'), -payment.amount, payment.amount)], session=uow.session)
+        await apply_dashboard_delta(remaining=-payment.amount, paid=payment.amount, session=uow.session)
+        return payment
     
-    await db.debts.update_one(
-        {"id": payment_data.debt_id},
-        {"$set": {
-            "paid_amount": new_paid_amount,
-            "remaining_amount": new_remaining,
-            "status": new_status
-        }}
-    )
+    payment = await UnitOfWork.run(work)
+    await mark_changed("debts", "payments", "customers")
     
     return payment
 
-@api_router.get("/payments", response_model=List[Payment])
-async def get_payments(customer_id: Optional[str] = None):
+@api_router.post("/payments/import", response_model=ImportReport)
+async def import_payments_route(
+    request: Request,
+    import_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    return await run_import(request, "payments", import_format)
+
+@api_router.get("/payments", response_model=Page[Payment])
+async def get_payments(
+    request: Request,
+    customer_id: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None
+):
     query = {}
     if customer_id:
         query["customer_id"] = customer_id
+    selected = parse_fields(fields, Payment, "payment_date")
     
-    payments = await db.payments.find(query, {"_id": 0}).sort("payment_date", -1).to_list(1000)
-    for payment in payments:
-        deserialize_doc(payment)
-    return payments
+    async def load():
+        payments, next_cursor = await paginate(
+            db.payments, query, "payment_date", -1, limit, after, projection=selected and fields_projection(selected)
+        )
+        return model_json(Page[sparse_model(Payment, selected)], {"items": payments, "next_cursor": next_cursor})
+    
+    return await conditional_json(request, "payments", ("list", customer_id, limit, after, selected), load)
 
 @api_router.delete("/payments/{payment_id}")
 async def delete_payment(payment_id: str):
-    # Get payment details before deleting
-    payment = await db.payments.find_one({"id": payment_id})
-    if not payment:
-        raise HTTPException(status_code=404, detail="Pago no encontrado")
-    
-    # Get the debt
-    debt = await db.debts.find_one({"id": payment['debt_id']})
-    if debt:
-        # Revert the payment from debt
-        new_paid_amount = debt['paid_amount'] - payment['amount']
-        new_remaining = debt['remaining_amount'] + payment['amount']
+    async def work(uow):
+        # Claim the payment first so concurrent deletes revert it only once
+        payment = await db.payments.find_one_and_delete({"id": payment_id}, session=uow.session)
+        if not payment:
+            raise HTTPException(status_code=404, detail="Pago no encontrado")
         
-        # Update debt status
-        if new_paid_amount == 0:
-            new_status = 'pending'
-        elif new_remaining > 0:
-            new_status = 'partial'
-        else:
-            new_status = 'paid'
-        
-        await db.debts.update_one(
-            {"id": payment['debt_id']},
-            {"$set": {
-                "paid_amount": new_paid_amount,
-                "remaining_amount": new_remaining,
-                "status": new_status
-            }}
+        # Revert the payment from debt
+        debt = await revert_payment_from_debt(payment['debt_id'], payment['amount'], session=uow.session)
+        # An installment payment reopens its installment so it can be paid again
+        reopened = await db.installments.update_one(
+            {"payment_id": payment['id']},
+            {"$set": {"paid": False}, "$unset": {"payment_date": "", "payment_id": ""}},
+            session=uow.session
         )
+        await rollups.mark_stale(db, rollups.day_keys([payment.get('payment_date')]), session=uow.session)
+        if debt:
+            await apply_customer_balances([(debt.get('customer_id'), payment['amount'], -payment['amount'])], session=uow.session)
+            await apply_dashboard_delta(remaining=payment['amount'], paid=-payment['amount'], session=uow.session)
+        return payment, reopened.modified_count
     
-    # Delete payment
-    await db.payments.delete_one({"id": payment_id})
+    payment, reopened = await UnitOfWork.run(work)
+    await mark_changed("debts", "payments", "customers", *(["installments"] if reopened else []))
     
     return {"message": "Pago eliminado y deuda actualizada"}
 
 # ============= DASHBOARD & REPORTS =============
 
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats():
-    # Count unique customers from debts
-    debts_list = await db.debts.find({}, {"_id": 0}).to_list(10000)
-    unique_customers = len(set(debt.get('customer_name', '') for debt in debts_list))
-    
-    # Calculate totals from debts
-    total_debts = sum(debt.get('remaining_amount', 0) for debt in debts_list)
-    total_paid = sum(debt.get('paid_amount', 0) for debt in debts_list)
-    
-    # Overdue debts
-    now = datetime.now(timezone.utc).isoformat()
-    overdue_count = await db.debts.count_documents({
-        "status": {"$in": ["overdue", "pending", "partial"]},
-        "due_date": {"$lt": now}
-    })
-    
-    # Recent payments
-    recent_payments_docs = await db.payments.find({}, {"_id": 0}).sort("payment_date", -1).limit(5).to_list(5)
-    for doc in recent_payments_docs:
-        deserialize_doc(doc)
-    recent_payments = [Payment(**doc) for doc in recent_payments_docs]
-    
-    return DashboardStats(
-        total_customers=unique_customers,
-        total_debts=total_debts,
-        total_paid=total_paid,
-        total_pending=total_debts,
-        overdue_debts=overdue_count,
-        recent_payments=recent_payments
+async def get_dashboard_stats(request: Request):
+    async def load():
+        # Totals are maintained incrementally by the debt and payment routes
+        aggregates = await get_dashboard_aggregates()
+        
+        # Recent payments
+        recent_payments_docs = await db.payments.find({}, {"_id": 0}).sort("payment_date", -1).limit(5).to_list(5)
+        
+        return model_json(DashboardStats, {
+            "total_customers": aggregates.get('total_customers', 0),
+            "total_debts": aggregates.get('total_debts', 0),
+            "total_paid": aggregates.get('total_paid', 0),
+            "total_pending": aggregates.get('total_debts', 0),
+            "overdue_debts": aggregates.get('overdue_debts', 0),
+            "recent_payments": recent_payments_docs
+        })
+    
+    return await conditional_json(
+        request, "dashboard", ("stats",), load,
+        depends=["debts", "payments", "dashboard"], period=OVERDUE_COUNT_TTL_SECONDS
+    )
+
+@api_router.post("/admin/rollups/run", response_model=rollups.RollupRunResult)
+async def run_daily_rollups():
+    return await roll_up_days()
+
+@api_router.post("/admin/orphans/collect", response_model=OrphanCollectionResult)
+async def collect_orphaned_documents():
+    return await collect_orphans()
+
+@api_router.post("/dashboard/aggregates/rebuild", response_model=AggregateRebuildReport)
+async def rebuild_dashboard_stats():
+    report = await rebuild_dashboard_aggregates()
+    if report is None:
+        raise HTTPException(status_code=409, detail="Ya se están recalculando los totales")
+    return report
+
+@api_router.get("/admin/indexes/diagnostics", response_model=List[IndexDiagnostic])
+async def get_index_diagnostics():
+    return await explain_route_queries()
+
+_reconciliation_task = None
+
+@api_router.post("/admin/reconciliation/run", response_model=reconciliation.ReconciliationRun)
+async def run_reconciliation(max_batches: Optional[int] = Query(None, ge=1)):
+    """Resume the unfinished reconciliation run, or start one, in the background"""
+    global _reconciliation_task
+    run = await reconciliation.current_run(db) or await reconciliation.start_run(db)
+    if _reconciliation_task is None or _reconciliation_task.done():
+        _reconciliation_task = asyncio.create_task(
+            reconciliation.reconcile(db, RECONCILE_BATCH_SIZE, max_batches)
+        )
+        background_tasks.append(_reconciliation_task)
+    return run
+
+@api_router.get("/admin/reconciliation/runs/{run_id}", response_model=reconciliation.ReconciliationRun)
+async def get_reconciliation_run(run_id: str):
+    run = await reconciliation.get_run(db, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Conciliación no encontrada")
+    return run
+
+@api_router.get(
+    "/admin/reconciliation/runs/{run_id}/discrepancies",
+    response_model=Page[reconciliation.Discrepancy]
+)
+async def get_reconciliation_discrepancies(
+    run_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None
+):
+    discrepancies, next_cursor = await paginate(
+        db.reconciliation_discrepancies, {"run_id": run_id}, "debt_id", 1, limit, after
+    )
+    return model_response(Page[reconciliation.Discrepancy], {"items": discrepancies, "next_cursor": next_cursor})
+
+@api_router.get("/reports/summary", response_model=reporting.ReportSummary)
+async def get_report_summary():
+    return await reporting.build_summary(db)
+
+@api_router.get("/reports/customers", response_model=List[reporting.CustomerTotals])
+async def get_customer_report(limit: int = Query(50, ge=1, le=1000)):
+    return await reporting.customer_totals(db, limit)
+
+@api_router.get("/reports/daily", response_model=List[rollups.DailyRollup])
+async def get_daily_report(request: Request, start: Optional[date] = None, end: Optional[date] = None):
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= MAX_ROLLUP_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Rango inválido (máximo {MAX_ROLLUP_RANGE_DAYS} días)")
+    
+    async def load():
+        return model_json(List[rollups.DailyRollup], await rollups.rollup_range(db, start, end))
+    
+    # Today is computed live, so the ETag also follows debts and payments
+    return await conditional_json(
+        request, "daily_rollups", ("range", start, end), load,
+        depends=["daily_rollups", "debts", "payments"], period=OVERDUE_COUNT_TTL_SECONDS
+    )
+
+ANALYTICS_DEPENDS = ["debts", "installments"]
+
+@api_router.get("/reports/aging", response_model=analytics.AgingReport)
+async def get_aging_report(request: Request):
+    async def load():
+        report = await analytics.aging_report(db, ANALYTICS_BATCH_SIZE)
+        return model_json(analytics.AgingReport, report)
+    
+    return await conditional_json(
+        request, "analytics", ("aging",), load, depends=ANALYTICS_DEPENDS, period=ANALYTICS_PERIOD_SECONDS
+    )
+
+@api_router.get("/reports/cashflow", response_model=analytics.CashflowReport)
+async def get_cashflow_report(request: Request, weeks: int = Query(12, ge=1, le=104)):
+    async def load():
+        report = await analytics.cashflow_report(db, weeks, ANALYTICS_BATCH_SIZE)
+        return model_json(analytics.CashflowReport, report)
+    
+    return await conditional_json(
+        request, "analytics", ("cashflow", weeks), load, depends=ANALYTICS_DEPENDS, period=ANALYTICS_PERIOD_SECONDS
     )
 
+EXPORT_COLLECTIONS = {
+    "customers": list(Customer.model_fields),
+    "debts": list(Debt.model_fields),
+    "payments": list(Payment.model_fields),
+}
+
+def export_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+async def iter_export_batches(collection: str):
+    """Yield documents of a collection in batches without loading it whole"""
+    cursor = db[collection].find({}, CUSTOMER_PROJECTION).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def stream_json_export():
+    # Same document shape as the original export, written incrementally
+    yield "{"
+    for collection in EXPORT_COLLECTIONS:
+        yield f'"{collection}": ['
+        first = True
+        async for batch in iter_export_batches(collection):
+            chunk = ",".join(json.dumps(doc, default=export_default) for doc in batch)
+            yield chunk if first else "," + chunk
+            first = False
+        yield "], "
+    yield f'"exported_at": "{datetime.now(timezone.utc).isoformat()}"}}'
+
+async def stream_ndjson_export():
+    for collection in EXPORT_COLLECTIONS:
+        async for batch in iter_export_batches(collection):
+            yield "".join(
+                json.dumps({"collection": collection, "data": doc}, default=export_default) + "\n"
+                for doc in batch
+            )
+
+async def stream_csv_export(collection: str):
+    columns = EXPORT_COLLECTIONS[collection]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    async for batch in iter_export_batches(collection):
+        for doc in batch:
+            writer.writerow({k: export_default(v) if isinstance(v, datetime) else v for k, v in doc.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
 @api_router.get("/reports/export")
-async def export_report():
-    customers = await db.customers.find({}, {"_id": 0}).to_list(10000)
-    debts = await db.debts.find({}, {"_id": 0}).to_list(10000)
-    payments = await db.payments.find({}, {"_id": 0}).to_list(10000)
+async def export_report(
+    export_format: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    collection: str = Query("debts", pattern="^(customers|debts|payments)$")
+):
+    stamp = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    if export_format == "csv":
+        body = stream_csv_export(collection)
+        media_type = "text/csv"
+        filename = f"reporte-{collection}-{stamp}.csv"
+    elif export_format == "ndjson":
+        body = stream_ndjson_export()
+        media_type = "application/x-ndjson"
+        filename = f"reporte-{stamp}.ndjson"
+    else:
+        body = stream_json_export()
+        media_type = "application/json"
+        filename = f"reporte-{stamp}.json"
     
-    return {
-        "customers": customers,
-        "debts": debts,
-        "payments": payments,
-        "exported_at": datetime.now(timezone.utc).isoformat()
-    }
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.get("/events")
+async def stream_events():
+    """Server-sent events with debt, payment and installment changes"""
+    queue = event_bus.subscribe()
+    
+    async def stream():
+        try:
+            yield f"retry: {int(EVENT_POLL_INTERVAL_SECONDS * 1000)}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=export_default)}\n\n"
+        finally:
+            event_bus.unsubscribe(queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ============= ROOT & MIDDLEWARE =============
 
@@ -615,6 +2942,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks = []
+
+@app.on_event("startup")
+async def startup_indexes():
+    await ensure_indexes()
+    if INDEX_DIAGNOSTICS:
+        await explain_route_queries()
+
+@app.on_event("startup")
+async def startup_datetime_migration():
+    background_tasks.append(asyncio.create_task(run_once("datetime-fields", migrate_datetime_fields)))
+
+@app.on_event("startup")
+async def startup_search_backfill():
+    background_tasks.append(asyncio.create_task(run_once("customer-search-fields", backfill_search_tokens)))
+
+@app.on_event("startup")
+async def startup_customer_backfill():
+    background_tasks.append(asyncio.create_task(backfill_customers(startup=True)))
+
+@app.on_event("startup")
+async def startup_overdue_sweeper():
+    if OVERDUE_SWEEP_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_overdue_sweeper()))
+
+@app.on_event("startup")
+async def startup_orphan_collector():
+    if ORPHAN_GC_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_orphan_collector()))
+
+@app.on_event("startup")
+async def startup_rollup_job():
+    if ROLLUP_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_rollup_job()))
+
+@app.on_event("startup")
+async def startup_event_feed():
+    background_tasks.append(asyncio.create_task(run_event_feed()))
+
+@app.on_event("shutdown")
+async def shutdown_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    password_pool.executor.shutdown(wait=False)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+# ============= MAINTENANCE COMMANDS =============
+# Usage: python server.py <command>
+
+COMMANDS = {
+    "rebuild-aggregates": rebuild_dashboard_aggregates,
+    "ensure-indexes": ensure_indexes,
+    "explain-indexes": explain_route_queries,
+    "sweep-overdue": sweep_overdue_debts,
+    "backfill-search": backfill_search_tokens,
+    "backfill-customers": backfill_customers,
+    "rebuild-balances": rebuild_customer_balances,
+    "migrate-dates": migrate_datetime_fields,
+    "check-transactions": check_transactions,
+    "check-cache": check_cache,
+    "reconcile": lambda: reconciliation.reconcile(db, RECONCILE_BATCH_SIZE),
+    "collect-orphans": collect_orphans,
+    "rollups": roll_up_days,
+}
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2 or sys.argv[1] not in COMMANDS:
+        print(f"Usage: python server.py [{'|'.join(COMMANDS)}]")
+        sys.exit(1)
+    print(asyncio.run(COMMANDS[sys.argv[1]]()))
@@ -0,0 +1,236 @@
+import requests
+import os
+import sys
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+def load_server():
+    """Import backend/server.py for in-process benchmarks (no database calls are made)"""
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "benchmark")
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+class SemiDeusBenchmark:
+    def __init__(self, base_url="https://semideus-finance.preview.emergentagent.com"):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api"
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def report(self, name, latencies_ms):
+        print(f"   {name}: n={len(latencies_ms)} "
+              f"p50={self.percentile(latencies_ms, 50):.1f}ms "
+              f"p99={self.percentile(latencies_ms, 99):.1f}ms "
+              f"max={max(latencies_ms):.1f}ms")
+
+    def timed_get(self, endpoint):
+        started = time.perf_counter()
+        requests.get(f"{self.api_url}/{endpoint}")
+        return (time.perf_counter() - started) * 1000
+
+    def bench_login_latency(self, logins=200, login_concurrency=16, probes=200, probe_endpoint="dashboard/stats"):
+        """p99 latency of an unrelated endpoint, idle and while logins run"""
+        print("\n🔍 Benchmark: unrelated endpoint latency during logins")
+        timestamp = datetime.now().strftime('%H%M%S')
+        credentials = {"username": f"bench_{timestamp}", "password": "BenchPass123!"}
+        requests.post(f"{self.api_url}/auth/register", json={
+            **credentials, "email": f"bench_{timestamp}@example.com"
+        })
+
+        idle = [self.timed_get(probe_endpoint) for _ in range(probes)]
+        self.report(f"{probe_endpoint} (idle)", idle)
+
+        def login(_):
+            requests.post(f"{self.api_url}/auth/login", json=credentials)
+
+        with ThreadPoolExecutor(max_workers=login_concurrency) as pool:
+            pending = [pool.submit(login, i) for i in range(logins)]
+            loaded = [self.timed_get(probe_endpoint) for _ in range(probes)]
+            for future in pending:
+                future.result()
+        self.report(f"{probe_endpoint} (during {logins} logins)", loaded)
+
+        metrics = requests.get(f"{self.api_url}/metrics/password-hashing").json()
+        print(f"   Password pool: completed={metrics['completed']} rejected={metrics['rejected']} "
+              f"avg={metrics['avg_duration_ms']:.1f}ms")
+        print(f"   p99 loaded/idle: {self.percentile(loaded, 99) / max(self.percentile(idle, 99), 0.001):.2f}x")
+
+    def bench_serialization(self, sizes=(1000, 10000), rounds=20):
+        """List response throughput: FastAPI response_model path vs TypeAdapter fast path"""
+        print("\n🔍 Benchmark: list response serialization")
+        server = load_server()
+        from typing import List
+        from pydantic import TypeAdapter
+
+        adapter = TypeAdapter(List[server.Debt])
+        now = datetime.now(timezone.utc)
+        for size in sizes:
+            docs = [{
+                "id": str(uuid.uuid4()),
+                "customer_name": f"Cliente {i}",
+                "description": "Camisetas",
+                "num_installments": 4,
+                "installment_amount": 25.0,
+                "total_amount": 100.0,
+                "paid_amount": 25.0,
+                "remaining_amount": 75.0,
+                "due_date": now,
+                "status": "partial",
+                "created_at": now,
+            } for i in range(size)]
+
+            def default_path():
+                # What FastAPI does with response_model=List[Debt] and a JSONResponse
+                validated = adapter.validate_python(docs)
+                return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+            def fast_path():
+                return server.model_response(List[server.Debt], docs).body
+
+            for name, func in (("response_model", default_path), ("TypeAdapter.dump_json", fast_path)):
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    func()
+                elapsed = (time.perf_counter() - started) / rounds
+                print(f"   {size:>6} items {name:<22} {elapsed * 1000:8.1f}ms/response "
+                      f"{size / elapsed:12,.0f} items/s")
+
+    def bench_import(self, rows=100000, sample=1000):
+        """Bulk import throughput vs one POST per row (extrapolated from a sample)"""
+        print(f"\n🔍 Benchmark: bulk import of {rows:,} rows")
+        run = uuid.uuid4().hex[:8]
+        customers = [{"id": f"bench-{run}-c{i}", "name": f"Cliente {i}", "phone": f"555{i:07d}"} for i in range(rows)]
+        debts = [{
+            "id": f"bench-{run}-d{i}",
+            "customer_id": f"bench-{run}-c{i}",
+            "customer_name": f"Cliente {i}",
+            "description": "Camisetas",
+            "total_amount": 120.0,
+            "num_installments": 3,
+            "due_date": "2030-01-01T00:00:00Z",
+        } for i in range(rows)]
+
+        for collection, docs in (("customers", customers), ("debts", debts)):
+            body = "\n".join(json.dumps(doc) for doc in docs).encode()
+            started = time.perf_counter()
+            report = requests.post(
+                f"{self.api_url}/{collection}/import",
+                params={"format": "ndjson"},
+                data=body,
+                headers={"Content-Type": "application/x-ndjson"}
+            ).json()
+            elapsed = time.perf_counter() - started
+            print(f"   {collection:<10} bulk     {report['inserted']:>8,} rows in {elapsed:7.1f}s "
+                  f"{report['inserted'] / elapsed:10,.0f} rows/s (failed: {report['failed']})")
+
+            started = time.perf_counter()
+            for doc in docs[:sample]:
+                # The single-row routes assign their own ids
+                requests.post(f"{self.api_url}/{collection}", json={
+                    key: value for key, value in doc.items() if key not in ("id", "customer_id")
+                })
+            elapsed = time.perf_counter() - started
+            print(f"   {collection:<10} per-row  {sample:>8,} rows in {elapsed:7.1f}s "
+                  f"{sample / elapsed:10,.0f} rows/s (~{rows / sample * elapsed:,.0f}s for {rows:,})")
+
+    def bench_analytics(self, installments=1000000, per_debt=4, batch_size=5000):
+        """Aging/cashflow on columnar frames vs a per-document Python loop (in-process)"""
+        print(f"\n🔍 Benchmark: aging and cashflow over {installments:,} installments")
+        load_server()
+        import analytics
+        from datetime import timedelta
+
+        now = datetime.now(timezone.utc)
+        debts = [{
+            "id": f"d{i}",
+            "product_type": ("camisetas", "pantalones", "accesorios")[i % 3],
+            "installment_type": ("mensual", "semanal")[i % 2],
+            "remaining_amount": 100.0 - (i % 5) * 10,
+        } for i in range(installments // per_debt)]
+        records = [{
+            "debt_id": f"d{i // per_debt}",
+            "amount": 25.0,
+            "due_date": now + timedelta(days=(i % 240) - 120),
+        } for i in range(installments)]
+        batches = [records[start:start + batch_size] for start in range(0, len(records), batch_size)]
+
+        started = time.perf_counter()
+        installment_frame = analytics.frame_from_batches(batches, analytics.INSTALLMENT_COLUMNS)
+        debt_frame = analytics.frame_from_batches([debts], analytics.DEBT_COLUMNS)
+        built = time.perf_counter() - started
+        print(f"   {'build frames':<18} {built * 1000:8.0f}ms ({len(batches)} batches of {batch_size:,})")
+
+        results = {}
+        for name, func in (
+            ("aging (frames)", lambda: analytics.compute_aging(installment_frame, debt_frame, now)),
+            ("cashflow (frames)", lambda: analytics.compute_cashflow(installment_frame, debt_frame, now, 12)),
+        ):
+            started = time.perf_counter()
+            results[name] = func()
+            print(f"   {name:<18} {(time.perf_counter() - started) * 1000:8.0f}ms")
+
+        def python_aging():
+            # The same buckets and delinquency flags with dicts and a loop per document
+            by_debt = {}
+            for record in records:
+                by_debt.setdefault(record["debt_id"], []).append(record)
+            buckets = {bucket: [0, set(), 0.0] for bucket in analytics.AGING_BUCKETS}
+            delinquent = {}
+            for debt in debts:
+                rows = sorted(by_debt.get(debt["id"], []), key=lambda record: record["due_date"])
+                credit = max(sum(record["amount"] for record in rows) - debt["remaining_amount"], 0.0)
+                for record in rows:
+                    covered = min(credit, record["amount"])
+                    credit -= covered
+                    outstanding = record["amount"] - covered
+                    if outstanding <= 0.005:
+                        continue
+                    days = (now - record["due_date"]).days
+                    bucket = "current" if days <= 0 else "1-30" if days <= 30 else "31-60" if days <= 60 \
+                        else "61-90" if days <= 90 else "90+"
+                    entry = buckets[bucket]
+                    entry[0] += 1
+                    entry[1].add(debt["id"])
+                    entry[2] += outstanding
+                    if days > 0:
+                        key = (debt["product_type"], debt["installment_type"])
+                        delinquent.setdefault(key, set()).add(debt["id"])
+            return sum(entry[2] for entry in buckets.values())
+
+        started = time.perf_counter()
+        total = python_aging()
+        print(f"   aging (dict loop)  {(time.perf_counter() - started) * 1000:8.0f}ms")
+        print(f"   outstanding: frames ${results['aging (frames)'].total_outstanding:,.2f}, loop ${total:,.2f}")
+
+def main():
+    benchmark = SemiDeusBenchmark(*sys.argv[2:3])
+    benchmarks = {
+        "login-latency": benchmark.bench_login_latency,
+        "serialization": benchmark.bench_serialization,
+        "import": benchmark.bench_import,
+        "analytics": benchmark.bench_analytics,
+    }
+
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print(f"Usage: python backend_benchmark.py [{'|'.join(benchmarks)}] [base_url]")
+        return 1
+
+    print("🚀 Starting SEMI DEUS ART API Benchmarks...")
+    print("=" * 60)
+    benchmarks[sys.argv[1]]()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
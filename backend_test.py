@@ -1,6 +1,7 @@
 import requests
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 class SemiDeusAPITester:
@@ -159,8 +160,8 @@ class SemiDeusAPITester:
             200
         )
         
-        if success and isinstance(response, list):
-            print(f"   Found {len(response)} customers")
+        if success and isinstance(response.get('items'), list):
+            print(f"   Found {len(response['items'])} customers (next_cursor: {response['next_cursor']})")
             return True
         return False
 
@@ -174,8 +175,8 @@ class SemiDeusAPITester:
             data={"search": "Juan"}
         )
         
-        if success and isinstance(response, list):
-            print(f"   Search returned {len(response)} customers")
+        if success and isinstance(response.get('items'), list):
+            print(f"   Search returned {len(response['items'])} customers")
             return True
         return False
 
@@ -228,6 +229,7 @@ class SemiDeusAPITester:
             
         debt_data = {
             "customer_id": self.test_customer_id,
+            "customer_name": "",
             "description": "Camisas polo x3",
             "total_amount": 150.00,
             "due_date": (datetime.now() + timedelta(days=30)).isoformat()
@@ -256,11 +258,25 @@ class SemiDeusAPITester:
             200
         )
         
-        if success and isinstance(response, list):
-            print(f"   Found {len(response)} debts")
+        if success and isinstance(response.get('items'), list):
+            print(f"   Found {len(response['items'])} debts (next_cursor: {response['next_cursor']})")
             return True
         return False
 
+    def test_sparse_fields(self):
+        """fields= returns only the requested columns plus id and the sort field"""
+        success, response = self.run_test(
+            "Get Debts with Fields",
+            "GET",
+            "debts?fields=customer_name,remaining_amount",
+            200
+        )
+        allowed = {"id", "created_at", "customer_name", "remaining_amount"}
+        if not success or any(set(item) - allowed for item in response.get('items', [])):
+            return False
+        success, _ = self.run_test("Reject Unknown Fields", "GET", "debts?fields=nope", 400)
+        return success
+
     def test_filter_debts_by_status(self):
         """Test filtering debts by status"""
         success, response = self.run_test(
@@ -271,8 +287,8 @@ class SemiDeusAPITester:
             data={"status": "pending"}
         )
         
-        if success and isinstance(response, list):
-            print(f"   Found {len(response)} pending debts")
+        if success and isinstance(response.get('items'), list):
+            print(f"   Found {len(response['items'])} pending debts")
             return True
         return False
 
@@ -316,6 +332,191 @@ class SemiDeusAPITester:
             return True
         return False
 
+    def test_concurrent_payments(self, workers=20, amount=5.00):
+        """Fire parallel payments at one debt and check that none is lost"""
+        total = workers * amount
+        success, debt = self.run_test(
+            "Create Debt for Concurrent Payments",
+            "POST",
+            "debts",
+            200,
+            data={
+                "customer_name": "Concurrencia Test",
+                "description": "Stress test de pagos",
+                "total_amount": total
+            }
+        )
+        if not success:
+            return False
+        
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        
+        def pay(_):
+            return requests.post(
+                f"{self.api_url}/payments",
+                json={"debt_id": debt['id'], "amount": amount, "payment_method": "cash"},
+                headers=headers
+            ).status_code
+        
+        # One extra payment must be rejected once the debt is fully paid
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            statuses = list(pool.map(pay, range(workers + 1)))
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Concurrent Payments ({workers + 1} parallel)...")
+        final = requests.get(f"{self.api_url}/debts/{debt['id']}", headers=headers).json()
+        accepted = statuses.count(200)
+        rejected = statuses.count(400)
+        print(f"   Accepted: {accepted}, rejected: {rejected}")
+        print(f"   Debt paid_amount: {final['paid_amount']}, remaining: {final['remaining_amount']}, status: {final['status']}")
+        
+        if (accepted == workers and rejected == 1
+                and abs(final['paid_amount'] - total) < 0.01
+                and abs(final['remaining_amount']) < 0.01
+                and final['status'] == 'paid'):
+            self.tests_passed += 1
+            print("✅ Passed - No lost updates")
+            return True
+        print("❌ Failed - Debt totals do not match the accepted payments")
+        return False
+
+    def test_batch_installment_payment(self):
+        """Pay the next installments of a debt in one batch call"""
+        success, debt = self.run_test(
+            "Create Debt for Batch Installments",
+            "POST",
+            "debts",
+            200,
+            data={
+                "customer_name": "Lote Test",
+                "description": "Pago de parcelas en lote",
+                "num_installments": 3,
+                "total_amount": 90.00
+            }
+        )
+        if not success:
+            return False
+        
+        success, response = self.run_test(
+            "Batch Pay Installments",
+            "POST",
+            "installments/pay",
+            200,
+            data={"debt_id": debt['id'], "count": 2}
+        )
+        if success and len(response.get('paid', [])) == 2 and abs(response['total_amount'] - 60.00) < 0.01:
+            print(f"   Paid {len(response['paid'])} installments, total ${response['total_amount']}")
+            return True
+        return False
+
+    def test_installments_after_cash_payment(self):
+        """Installments covered by a cash payment are not charged again"""
+        success, debt = self.run_test(
+            "Create Debt for Covered Installments",
+            "POST",
+            "debts",
+            200,
+            data={
+                "customer_name": "Parcelas Cubiertas Test",
+                "description": "Pago en efectivo y luego parcelas",
+                "num_installments": 3,
+                "total_amount": 90.00
+            }
+        )
+        if not success:
+            return False
+        
+        success, _ = self.run_test(
+            "Cash Payment Before Installments",
+            "POST",
+            "payments",
+            200,
+            data={"debt_id": debt['id'], "amount": 10.00}
+        )
+        if not success:
+            return False
+        success, response = self.run_test(
+            "Batch Pay Remaining Installments",
+            "POST",
+            "installments/pay",
+            200,
+            data={"debt_id": debt['id'], "count": 3}
+        )
+        if not success:
+            return False
+        success, updated = self.run_test("Get Fully Paid Debt", "GET", f"debts/{debt['id']}", 200)
+        if success and abs(response['total_amount'] - 80.00) < 0.01 and abs(updated['remaining_amount']) < 0.01:
+            print(f"   Charged ${response['total_amount']}, remaining ${updated['remaining_amount']}")
+            return True
+        return False
+
+    def test_customer_balances(self):
+        """Debts and payments linked by customer_id update the customer's balances"""
+        if not self.test_customer_id:
+            print("❌ No customer ID available for testing")
+            return False
+        
+        success, before = self.run_test("Get Customer Balances", "GET", f"customers/{self.test_customer_id}", 200)
+        if not success:
+            return False
+        success, debt = self.run_test(
+            "Create Linked Debt",
+            "POST",
+            "debts",
+            200,
+            data={
+                "customer_id": self.test_customer_id,
+                "customer_name": "",
+                "description": "Deuda vinculada",
+                "total_amount": 80.00
+            }
+        )
+        if not success:
+            return False
+        success, _ = self.run_test(
+            "Pay Linked Debt",
+            "POST",
+            "payments",
+            200,
+            data={"debt_id": debt['id'], "amount": 30.00, "payment_method": "efectivo"}
+        )
+        if not success:
+            return False
+        
+        success, after = self.run_test("Get Updated Balances", "GET", f"customers/{self.test_customer_id}", 200)
+        success = success and self.run_test(
+            "Sort Customers by Debt", "GET", "customers?sort=total_debt", 200
+        )[0]
+        if success and abs(after['total_debt'] - before['total_debt'] - 50.00) < 0.01 \
+                and abs(after['total_paid'] - before['total_paid'] - 30.00) < 0.01:
+            print(f"   Balances: debt ${after['total_debt']}, paid ${after['total_paid']}")
+            return True
+        return False
+
+    def test_customer_statement(self):
+        """The statement nests each debt's installments and payments with running balances"""
+        if not self.test_customer_id:
+            print("❌ No customer ID available for testing")
+            return False
+        
+        success, response = self.run_test(
+            "Get Customer Statement",
+            "GET",
+            f"customers/{self.test_customer_id}/statement",
+            200
+        )
+        if not success or not isinstance(response.get('debts'), list):
+            return False
+        for debt in response['debts']:
+            payments = debt['payments']
+            if payments and abs(debt['total_amount'] - sum(p['amount'] for p in payments) - payments[-1]['balance']) > 0.01:
+                print(f"❌ Running balance mismatch on debt {debt['id']}")
+                return False
+        print(f"   Statement has {len(response['debts'])} debts (next_cursor: {response['next_cursor']})")
+        return True
+
     def test_get_payments(self):
         """Test getting payments list"""
         success, response = self.run_test(
@@ -325,11 +526,34 @@ class SemiDeusAPITester:
             200
         )
         
-        if success and isinstance(response, list):
-            print(f"   Found {len(response)} payments")
+        if success and isinstance(response.get('items'), list):
+            print(f"   Found {len(response['items'])} payments (next_cursor: {response['next_cursor']})")
             return True
         return False
 
+    def test_conditional_requests(self):
+        """Polling with If-None-Match returns 304 until the collection changes"""
+        headers = {}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Conditional Requests (ETag)...")
+        first = requests.get(f"{self.api_url}/payments", headers=headers)
+        etag = first.headers.get('ETag')
+        if not etag:
+            print("❌ Failed - No ETag header")
+            return False
+        
+        unchanged = requests.get(f"{self.api_url}/payments", headers={**headers, 'If-None-Match': etag})
+        print(f"   ETag: {etag}, repeat poll status: {unchanged.status_code}")
+        if unchanged.status_code == 304:
+            self.tests_passed += 1
+            print("✅ Passed - Unchanged list not re-sent")
+            return True
+        print("❌ Failed - Expected 304 Not Modified")
+        return False
+
     def test_dashboard_stats(self):
         """Test dashboard statistics"""
         success, response = self.run_test(
@@ -344,6 +568,28 @@ class SemiDeusAPITester:
             return True
         return False
 
+    def test_aging_and_cashflow(self):
+        """Aging buckets add up to the outstanding total; cash flow has one row per week"""
+        success, aging = self.run_test("Get Aging Report", "GET", "reports/aging", 200)
+        if not success or abs(sum(b['amount'] for b in aging['buckets']) - aging['total_outstanding']) > 0.01:
+            return False
+        success, cashflow = self.run_test("Get Cash Flow Report", "GET", "reports/cashflow?weeks=4", 200)
+        if success and len(cashflow['weeks']) == 4:
+            print(f"   Outstanding ${aging['total_outstanding']:.2f}, overdue ${cashflow['overdue_amount']:.2f}")
+            return True
+        return False
+
+    def test_daily_rollups(self):
+        """Run the rollup job, then read up to a month of daily documents ending today"""
+        success, _ = self.run_test("Run Daily Rollups", "POST", "admin/rollups/run", 200)
+        if not success:
+            return False
+        success, days = self.run_test("Get Daily Report", "GET", "reports/daily", 200)
+        if success and 0 < len(days) <= 30 and days[-1]['day'] == datetime.utcnow().date().isoformat():
+            print(f"   Collected ${sum(day['amount_collected'] for day in days):.2f} over {len(days)} days")
+            return True
+        return False
+
     def test_export_report(self):
         """Test report export"""
         success, response = self.run_test(
@@ -358,21 +604,59 @@ class SemiDeusAPITester:
             return True
         return False
 
+    def test_bulk_import(self):
+        """Import customers from CSV and check the per-row error report"""
+        headers = {'Content-Type': 'text/csv'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        body = "name,phone,email\nImport Uno,5550001,\nImport Dos,5550002,no-es-email\n"
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Bulk Import (CSV)...")
+        response = requests.post(
+            f"{self.api_url}/customers/import", params={"format": "csv"}, data=body.encode(), headers=headers
+        )
+        report = response.json() if response.status_code == 200 else {}
+        print(f"   Report: {report}")
+        if report.get('inserted') == 1 and [error['row'] for error in report.get('errors', [])] == [2]:
+            self.tests_passed += 1
+            print("✅ Passed - Valid row imported, invalid row reported")
+            return True
+        print("❌ Failed - Unexpected import report")
+        return False
+
     def test_delete_debt(self):
         """Test debt deletion"""
         if not self.test_debt_id:
             print("❌ No debt ID available for test")
             return False
             
+        success, installments = self.run_test(
+            "Installments Before Delete", "GET", f"debts/{self.test_debt_id}/installments", 200
+        )
+        if not success or not installments['items']:
+            return False
         success, response = self.run_test(
             "Delete Debt",
             "DELETE",
             f"debts/{self.test_debt_id}",
             200
         )
+        if not success:
+            return False
         
-        if success:
-            print(f"   Debt deleted successfully")
+        # The delete cascades to the debt's installments and payments
+        success = self.run_test("Deleted Debt Is Gone", "GET", f"debts/{self.test_debt_id}", 404)[0]
+        success, remaining = self.run_test(
+            "Installments After Delete", "GET", f"debts/{self.test_debt_id}/installments", 200
+        )
+        success, payments = self.run_test(
+            "Payments After Delete", "GET", "payments", 200,
+            data={"customer_id": self.test_customer_id, "limit": 500}
+        )
+        if success and not remaining['items'] \
+                and not any(payment['debt_id'] == self.test_debt_id for payment in payments['items']):
+            print(f"   Debt deleted with its {len(installments['items'])} installments and payments")
             return True
         return False
 
@@ -382,15 +666,48 @@ class SemiDeusAPITester:
             print("❌ No customer ID available for test")
             return False
             
+        success, debts = self.run_test(
+            "Customer Debts Before Delete", "GET", "debts",
+            200, data={"customer_id": self.test_customer_id, "limit": 500}
+        )
+        if not success or not debts['items']:
+            return False
         success, response = self.run_test(
             "Delete Customer",
             "DELETE",
             f"customers/{self.test_customer_id}",
             200
         )
+        if not success:
+            return False
         
-        if success:
-            print(f"   Customer deleted successfully")
+        # The delete cascades to the customer's debts, their installments and payments
+        success, remaining = self.run_test(
+            "Customer Debts After Delete", "GET", "debts",
+            200, data={"customer_id": self.test_customer_id, "limit": 500}
+        )
+        if not success or remaining['items']:
+            return False
+        success, payments = self.run_test(
+            "Customer Payments After Delete", "GET", "payments",
+            200, data={"customer_id": self.test_customer_id, "limit": 500}
+        )
+        if not success or payments['items']:
+            return False
+        for debt in debts['items']:
+            success, installments = self.run_test(
+                "Installments of Deleted Customer Debt", "GET", f"debts/{debt['id']}/installments", 200
+            )
+            if not success or installments['items']:
+                return False
+        print(f"   Customer deleted with {len(debts['items'])} debts, their installments and payments")
+        return True
+
+    def test_collect_orphans(self):
+        """The orphan collector runs on demand and reports what it removed"""
+        success, response = self.run_test("Collect Orphans", "POST", "admin/orphans/collect", 200)
+        if success and response.get('installments', -1) >= 0 and response.get('payments', -1) >= 0:
+            print(f"   Removed {response['installments']} installments, {response['payments']} payments")
             return True
         return False
 
@@ -411,14 +728,25 @@ def main():
         tester.test_update_customer,
         tester.test_create_debt,
         tester.test_get_debts,
+        tester.test_sparse_fields,
         tester.test_filter_debts_by_status,
         tester.test_get_overdue_debts,
         tester.test_create_payment,
+        tester.test_concurrent_payments,
+        tester.test_batch_installment_payment,
+        tester.test_installments_after_cash_payment,
+        tester.test_customer_balances,
+        tester.test_customer_statement,
         tester.test_get_payments,
+        tester.test_conditional_requests,
         tester.test_dashboard_stats,
+        tester.test_aging_and_cashflow,
+        tester.test_daily_rollups,
         tester.test_export_report,
+        tester.test_bulk_import,
         tester.test_delete_debt,
         tester.test_delete_customer,
+        tester.test_collect_orphans,
     ]
     
     # Run all tests
@@ -0,0 +1,29 @@
+import { useEffect, useRef } from 'react';
+import { API } from '../App';
+
+const EVENT_TYPES = ['insert', 'update', 'invalidate', 'resync'];
+
+// Subscribes to the server-sent change events while the component is mounted.
+// The handler always sees the latest props/state of the component.
+export function useLiveEvents(handler) {
+  const handlerRef = useRef(handler);
+  handlerRef.current = handler;
+
+  useEffect(() => {
+    const source = new EventSource(`${API}/events`);
+    const listener = (message) => handlerRef.current(JSON.parse(message.data));
+    EVENT_TYPES.forEach((type) => source.addEventListener(type, listener));
+    return () => source.close();
+  }, []);
+}
+
+// Applies an insert/update event to a list of documents keyed by id
+export function applyListEvent(items, event) {
+  const index = items.findIndex((item) => item.id === event.id);
+  if (index === -1) {
+    return event.type === 'insert' ? [event.doc, ...items] : items;
+  }
+  const next = [...items];
+  next[index] = { ...next[index], ...event.doc };
+  return next;
+}
@@ -4,16 +4,23 @@ import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
+import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogDescription, DialogTrigger } from '@/components/ui/dialog';
 import { toast } from 'sonner';
-import { UserPlus, Search, Edit, Trash2, CheckCircle } from 'lucide-react';
+import { UserPlus, Search, Edit, Trash2, CheckCircle, FileText } from 'lucide-react';
+
+// Matches the backend's SEARCH_MIN_QUERY_CHARS
+const MIN_SEARCH_CHARS = 3;
 
 const CustomersPage = () => {
   const [customers, setCustomers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  const [sortBy, setSortBy] = useState('created_at');
   const [isDialogOpen, setIsDialogOpen] = useState(false);
   const [editingCustomer, setEditingCustomer] = useState(null);
+  const [statement, setStatement] = useState(null);
   const [formData, setFormData] = useState({
     name: '',
     phone: '',
@@ -22,16 +29,20 @@ const CustomersPage = () => {
     notes: '',
   });
 
+  // Debounce search so typing fires one request instead of one per keystroke
   useEffect(() => {
-    fetchCustomers();
-  }, []);
+    const timer = setTimeout(() => fetchCustomers(activeSearch), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, sortBy]);
 
-  const fetchCustomers = async (search = '') => {
+  const fetchCustomers = async (search = '', after = null) => {
     try {
-      const response = await apiClient.get('/customers', {
-        params: search ? { search } : {},
-      });
-      setCustomers(response.data);
+      // Search results are ranked by relevance; sorting applies to the full list
+      const params = search ? { search } : { sort: sortBy };
+      if (after) params.after = after;
+      const response = await apiClient.get('/customers', { params });
+      setCustomers(after ? (prev) => [...prev, ...response.data.items] : response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       toast.error('Error al cargar clientes');
     } finally {
@@ -42,7 +53,6 @@ const CustomersPage = () => {
   const handleSearch = (e) => {
     const value = e.target.value;
     setSearchTerm(value);
-    fetchCustomers(value);
   };
 
   const handleSubmit = async (e) => {
@@ -57,7 +67,7 @@ const CustomersPage = () => {
       }
       setIsDialogOpen(false);
       resetForm();
-      fetchCustomers(searchTerm);
+      fetchCustomers(activeSearch);
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Error al guardar cliente');
     }
@@ -76,11 +86,11 @@ const CustomersPage = () => {
   };
 
   const handleDelete = async (id) => {
-    if (window.confirm('¿Estás seguro de eliminar este cliente?')) {
+    if (window.confirm('¿Estás seguro de eliminar este cliente? También se eliminarán sus ventas, parcelas y pagos.')) {
       try {
         await apiClient.delete(`/customers/${id}`);
         toast.success('Cliente eliminado');
-        fetchCustomers(searchTerm);
+        fetchCustomers(activeSearch);
       } catch (error) {
         toast.error('Error al eliminar cliente');
       }
@@ -92,13 +102,23 @@ const CustomersPage = () => {
       try {
         const response = await apiClient.delete(`/customers/${customerId}/paid-debts`);
         toast.success(response.data.message);
-        fetchCustomers(searchTerm);
+        fetchCustomers(activeSearch);
       } catch (error) {
         toast.error('Error al eliminar deudas pagadas');
       }
     }
   };
 
+  // One call returns the customer's debts with their installments and payments
+  const fetchStatement = async (customerId, after = null) => {
+    try {
+      const response = await apiClient.get(`/customers/${customerId}/statement`, { params: after ? { after } : {} });
+      setStatement((prev) => (after ? { ...response.data, debts: [...prev.debts, ...response.data.debts] } : response.data));
+    } catch (error) {
+      toast.error('Error al cargar estado de cuenta');
+    }
+  };
+
   const resetForm = () => {
     setFormData({
       name: '',
@@ -195,16 +215,28 @@ const CustomersPage = () => {
         </Dialog>
       </div>
 
-      {/* Search */}
-      <div className="relative">
-        <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400" size={20} />
-        <Input
-          data-testid="customer-search-input"
-          placeholder="Buscar por nombre o teléfono..."
-          value={searchTerm}
-          onChange={handleSearch}
-          className="pl-10"
-        />
+      {/* Search & Sort */}
+      <div className="flex gap-4">
+        <div className="relative flex-1">
+          <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400" size={20} />
+          <Input
+            data-testid="customer-search-input"
+            placeholder="Buscar por nombre o teléfono..."
+            value={searchTerm}
+            onChange={handleSearch}
+            className="pl-10"
+          />
+        </div>
+        <Select value={sortBy} onValueChange={setSortBy} disabled={!!activeSearch}>
+          <SelectTrigger data-testid="customer-sort-select" className="w-56">
+            <SelectValue />
+          </SelectTrigger>
+          <SelectContent>
+            <SelectItem value="created_at">Más recientes</SelectItem>
+            <SelectItem value="total_debt">Mayor deuda</SelectItem>
+            <SelectItem value="total_paid">Mayor pagado</SelectItem>
+          </SelectContent>
+        </Select>
       </div>
 
       {/* Customers Grid */}
@@ -249,6 +281,9 @@ const CustomersPage = () => {
                   <p className="text-gray-800 font-medium" data-testid="customer-card-debt">
                     Deuda: ${customer.total_debt?.toFixed(2) || '0.00'}
                   </p>
+                  <p className="text-gray-600" data-testid="customer-card-paid">
+                    Pagado: ${customer.total_paid?.toFixed(2) || '0.00'}
+                  </p>
                 </div>
                 <Button
                   data-testid="customer-delete-paid-debts-button"
@@ -260,11 +295,76 @@ const CustomersPage = () => {
                   <CheckCircle size={16} />
                   Eliminar Deudas Pagadas
                 </Button>
+                <Button
+                  data-testid="customer-statement-button"
+                  onClick={() => fetchStatement(customer.id)}
+                  variant="outline"
+                  size="sm"
+                  className="w-full flex items-center gap-2"
+                >
+                  <FileText size={16} />
+                  Estado de Cuenta
+                </Button>
               </CardContent>
             </Card>
           ))}
+          {nextCursor && (
+            <div className="text-center col-span-full">
+              <Button data-testid="customers-load-more-button" variant="outline" onClick={() => fetchCustomers(activeSearch, nextCursor)}>
+                Cargar más
+              </Button>
+            </div>
+          )}
         </div>
       )}
+
+      {/* Statement */}
+      <Dialog open={!!statement} onOpenChange={(open) => !open && setStatement(null)}>
+        <DialogContent data-testid="customer-statement-dialog" className="max-w-2xl max-h-[80vh] overflow-y-auto">
+          <DialogHeader>
+            <DialogTitle>Estado de Cuenta: {statement?.customer.name}</DialogTitle>
+            <DialogDescription>
+              Deuda: ${statement?.customer.total_debt.toFixed(2)} · Pagado: ${statement?.customer.total_paid.toFixed(2)}
+            </DialogDescription>
+          </DialogHeader>
+          <div className="space-y-4">
+            {statement?.debts.length === 0 && <p className="text-gray-500 text-center">Sin deudas registradas</p>}
+            {statement?.debts.map((debt) => (
+              <div key={debt.id} data-testid="statement-debt" className="border rounded-lg p-3 text-sm space-y-2">
+                <div className="flex justify-between font-medium">
+                  <span>{debt.description}</span>
+                  <span>${debt.remaining_amount.toFixed(2)} / ${debt.total_amount.toFixed(2)}</span>
+                </div>
+                <div className="flex flex-wrap gap-2">
+                  {debt.installments.map((installment) => (
+                    <span
+                      key={installment.id}
+                      className={`px-2 py-1 rounded text-xs ${installment.paid ? 'bg-green-100 text-green-800' : 'bg-gray-100 text-gray-600'}`}
+                    >
+                      #{installment.installment_number} ${installment.amount.toFixed(2)}
+                    </span>
+                  ))}
+                </div>
+                {debt.payments.map((payment) => (
+                  <div key={payment.id} className="flex justify-between text-gray-600">
+                    <span>{new Date(payment.payment_date).toLocaleDateString('es-ES')} · ${payment.amount.toFixed(2)}</span>
+                    <span>Saldo: ${payment.balance.toFixed(2)}</span>
+                  </div>
+                ))}
+              </div>
+            ))}
+            {statement?.next_cursor && (
+              <Button
+                variant="outline"
+                className="w-full"
+                onClick={() => fetchStatement(statement.customer.id, statement.next_cursor)}
+              >
+                Cargar más
+              </Button>
+            )}
+          </div>
+        </DialogContent>
+      </Dialog>
     </div>
   );
 };
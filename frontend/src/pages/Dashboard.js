@@ -1,11 +1,15 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { apiClient } from '../App';
+import { useLiveEvents } from '@/hooks/use-live-events';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Users, DollarSign, AlertCircle, TrendingUp } from 'lucide-react';
 import { toast } from 'sonner';
 import { format } from 'date-fns';
 import { es } from 'date-fns/locale';
 
+// Bursts of change events (a debt's installments, an import) collapse into one refetch per interval
+const STATS_REFRESH_MS = 1000;
+
 const Dashboard = () => {
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -14,6 +18,19 @@ const Dashboard = () => {
     fetchStats();
   }, []);
 
+  const refreshTimer = useRef(null);
+
+  useEffect(() => () => clearTimeout(refreshTimer.current), []);
+
+  // Totals move with debt and payment changes; installment events always come with one of those
+  useLiveEvents((event) => {
+    if (event.collection === 'installments' || refreshTimer.current) return;
+    refreshTimer.current = setTimeout(() => {
+      refreshTimer.current = null;
+      fetchStats();
+    }, STATS_REFRESH_MS);
+  });
+
   const fetchStats = async () => {
     try {
       const response = await apiClient.get('/dashboard/stats');
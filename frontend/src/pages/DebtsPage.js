@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { apiClient } from '../App';
+import { useLiveEvents, applyListEvent } from '@/hooks/use-live-events';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
@@ -13,6 +14,7 @@ import { es } from 'date-fns/locale';
 
 const DebtsPage = () => {
   const [debts, setDebts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [isDialogOpen, setIsDialogOpen] = useState(false);
   const [isInstallmentsDialogOpen, setIsInstallmentsDialogOpen] = useState(false);
@@ -37,10 +39,31 @@ const DebtsPage = () => {
     fetchDebts();
   }, [filterStatus]);
 
+  useLiveEvents((event) => {
+    if (event.type === 'resync') {
+      fetchDebts();
+      if (isInstallmentsDialogOpen) fetchInstallments(selectedDebt.id);
+    } else if (event.collection === 'debts') {
+      // A filtered list may gain or lose rows when a status changes
+      if (event.type === 'invalidate' || filterStatus !== 'all') {
+        fetchDebts();
+      } else {
+        setDebts((prev) => applyListEvent(prev, event));
+      }
+    } else if (event.collection === 'installments' && isInstallmentsDialogOpen) {
+      if (event.type === 'invalidate') {
+        fetchInstallments(selectedDebt.id);
+      } else if (event.doc.debt_id === selectedDebt.id) {
+        setInstallments((prev) => applyListEvent(prev, event));
+      }
+    }
+  });
+
   const fetchData = async () => {
     try {
       const debtsRes = await apiClient.get('/debts');
-      setDebts(debtsRes.data);
+      setDebts(debtsRes.data.items);
+      setNextCursor(debtsRes.data.next_cursor);
     } catch (error) {
       toast.error('Error al cargar datos');
     } finally {
@@ -48,11 +71,13 @@ const DebtsPage = () => {
     }
   };
 
-  const fetchDebts = async () => {
+  const fetchDebts = async (after = null) => {
     try {
       const params = filterStatus !== 'all' ? { status: filterStatus } : {};
+      if (after) params.after = after;
       const response = await apiClient.get('/debts', { params });
-      setDebts(response.data);
+      setDebts(after ? (prev) => [...prev, ...response.data.items] : response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       toast.error('Error al cargar deudas');
     } finally {
@@ -74,7 +99,7 @@ const DebtsPage = () => {
   };
 
   const handleDelete = async (id) => {
-    if (window.confirm('¿Estás seguro de eliminar esta venta?')) {
+    if (window.confirm('¿Estás seguro de eliminar esta venta? También se eliminarán sus parcelas y pagos.')) {
       try {
         await apiClient.delete(`/debts/${id}`);
         toast.success('Venta eliminada');
@@ -85,11 +110,15 @@ const DebtsPage = () => {
     }
   };
 
+  const fetchInstallments = async (debtId) => {
+    const response = await apiClient.get(`/debts/${debtId}/installments`, { params: { limit: 100 } });
+    setInstallments(response.data.items);
+  };
+
   const handleViewInstallments = async (debt) => {
     setSelectedDebt(debt);
     try {
-      const response = await apiClient.get(`/debts/${debt.id}/installments`);
-      setInstallments(response.data);
+      await fetchInstallments(debt.id);
       setIsInstallmentsDialogOpen(true);
     } catch (error) {
       toast.error('Error al cargar parcelas');
@@ -101,14 +130,28 @@ const DebtsPage = () => {
       await apiClient.put(`/installments/${installmentId}/pay`);
       toast.success('Parcela pagada exitosamente');
       // Recargar parcelas y ventas
-      const response = await apiClient.get(`/debts/${selectedDebt.id}/installments`);
-      setInstallments(response.data);
+      await fetchInstallments(selectedDebt.id);
       fetchDebts();
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Error al pagar parcela');
     }
   };
 
+  const handlePayAllInstallments = async () => {
+    const pending = installments.filter((installment) => !installment.paid);
+    try {
+      const response = await apiClient.post('/installments/pay', {
+        debt_id: selectedDebt.id,
+        count: pending.length,
+      });
+      toast.success(`${response.data.paid.length} parcelas pagadas`);
+      await fetchInstallments(selectedDebt.id);
+      fetchDebts();
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Error al pagar parcelas');
+    }
+  };
+
   const resetForm = () => {
     setFormData({
       customer_name: '',
@@ -363,6 +406,13 @@ const DebtsPage = () => {
               </CardContent>
             </Card>
           ))}
+          {nextCursor && (
+            <div className="text-center">
+              <Button data-testid="debts-load-more-button" variant="outline" onClick={() => fetchDebts(nextCursor)}>
+                Cargar más
+              </Button>
+            </div>
+          )}
         </div>
       )}
 
@@ -420,6 +470,19 @@ const DebtsPage = () => {
               </Card>
             ))}
           </div>
+          {installments.some((installment) => !installment.paid) && (
+            <div className="flex justify-end">
+              <Button
+                data-testid="pay-all-installments-button"
+                onClick={handlePayAllInstallments}
+                variant="outline"
+                className="flex items-center gap-2"
+              >
+                <CheckCircle2 size={16} />
+                Pagar todas las pendientes
+              </Button>
+            </div>
+          )}
         </DialogContent>
       </Dialog>
     </div>
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { apiClient } from '../App';
+import { useLiveEvents, applyListEvent } from '@/hooks/use-live-events';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
@@ -11,9 +12,16 @@ import { DollarSign, Trash2 } from 'lucide-react';
 import { format } from 'date-fns';
 import { es } from 'date-fns/locale';
 
+// Only debts with something left to pay can receive a payment
+const OPEN_DEBT_STATUSES = 'pending,partial,overdue';
+// The debt picker only needs these columns
+const DEBT_PICKER_FIELDS = 'customer_name,remaining_amount,status';
+
 const PaymentsPage = () => {
   const [payments, setPayments] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [debts, setDebts] = useState([]);
+  const [debtsCursor, setDebtsCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [isDialogOpen, setIsDialogOpen] = useState(false);
   const [formData, setFormData] = useState({
@@ -27,15 +35,26 @@ const PaymentsPage = () => {
     fetchData();
   }, []);
 
+  useLiveEvents((event) => {
+    if (event.type === 'resync' || event.type === 'invalidate') {
+      if (event.collection !== 'installments') fetchData();
+    } else if (event.collection === 'payments') {
+      setPayments((prev) => applyListEvent(prev, event));
+    } else if (event.collection === 'debts') {
+      setDebts((prev) => applyListEvent(prev, event).filter(d => d.status !== 'paid'));
+    }
+  });
+
   const fetchData = async () => {
     try {
       const [paymentsRes, debtsRes] = await Promise.all([
         apiClient.get('/payments'),
-        apiClient.get('/debts'),
+        apiClient.get('/debts', { params: { status: OPEN_DEBT_STATUSES, fields: DEBT_PICKER_FIELDS } }),
       ]);
-      setPayments(paymentsRes.data);
-      // Filter only unpaid or partially paid debts
-      setDebts(debtsRes.data.filter(d => d.status !== 'paid'));
+      setPayments(paymentsRes.data.items);
+      setNextCursor(paymentsRes.data.next_cursor);
+      setDebts(debtsRes.data.items);
+      setDebtsCursor(debtsRes.data.next_cursor);
     } catch (error) {
       toast.error('Error al cargar datos');
     } finally {
@@ -43,6 +62,28 @@ const PaymentsPage = () => {
     }
   };
 
+  const fetchMorePayments = async () => {
+    try {
+      const response = await apiClient.get('/payments', { params: { after: nextCursor } });
+      setPayments((prev) => [...prev, ...response.data.items]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      toast.error('Error al cargar pagos');
+    }
+  };
+
+  const fetchMoreDebts = async () => {
+    try {
+      const response = await apiClient.get('/debts', {
+        params: { status: OPEN_DEBT_STATUSES, fields: DEBT_PICKER_FIELDS, after: debtsCursor },
+      });
+      setDebts((prev) => [...prev, ...response.data.items]);
+      setDebtsCursor(response.data.next_cursor);
+    } catch (error) {
+      toast.error('Error al cargar deudas');
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -124,6 +165,17 @@ const PaymentsPage = () => {
                     ))}
                   </SelectContent>
                 </Select>
+                {debtsCursor && (
+                  <Button
+                    data-testid="payment-debts-load-more-button"
+                    type="button"
+                    variant="link"
+                    className="px-0"
+                    onClick={fetchMoreDebts}
+                  >
+                    Cargar más deudas
+                  </Button>
+                )}
                 {selectedDebt && (
                   <p className="text-sm text-gray-600 mt-1" data-testid="payment-remaining-amount">
                     Monto pendiente: ${selectedDebt.remaining_amount.toFixed(2)}
@@ -230,6 +282,13 @@ const PaymentsPage = () => {
               </CardContent>
             </Card>
           ))}
+          {nextCursor && (
+            <div className="text-center">
+              <Button data-testid="payments-load-more-button" variant="outline" onClick={fetchMorePayments}>
+                Cargar más
+              </Button>
+            </div>
+          )}
         </div>
       )}
     </div>
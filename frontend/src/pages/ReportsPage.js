@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { apiClient } from '../App';
+import { apiClient, API } from '../App';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { toast } from 'sonner';
@@ -7,6 +7,10 @@ import { Download, FileText } from 'lucide-react';
 
 const ReportsPage = () => {
   const [stats, setStats] = useState(null);
+  const [summary, setSummary] = useState(null);
+  const [aging, setAging] = useState(null);
+  const [cashflow, setCashflow] = useState(null);
+  const [daily, setDaily] = useState([]);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -15,8 +19,18 @@ const ReportsPage = () => {
 
   const fetchStats = async () => {
     try {
-      const response = await apiClient.get('/dashboard/stats');
-      setStats(response.data);
+      const [statsRes, summaryRes, agingRes, cashflowRes, dailyRes] = await Promise.all([
+        apiClient.get('/dashboard/stats'),
+        apiClient.get('/reports/summary'),
+        apiClient.get('/reports/aging'),
+        apiClient.get('/reports/cashflow', { params: { weeks: 8 } }),
+        apiClient.get('/reports/daily'),
+      ]);
+      setStats(statsRes.data);
+      setSummary(summaryRes.data);
+      setAging(agingRes.data);
+      setCashflow(cashflowRes.data);
+      setDaily(dailyRes.data);
     } catch (error) {
       toast.error('Error al cargar estadísticas');
     } finally {
@@ -24,24 +38,20 @@ const ReportsPage = () => {
     }
   };
 
-  const handleExport = async () => {
-    try {
-      const response = await apiClient.get('/reports/export');
-      const dataStr = JSON.stringify(response.data, null, 2);
-      const dataBlob = new Blob([dataStr], { type: 'application/json' });
-      const url = URL.createObjectURL(dataBlob);
-      const link = document.createElement('a');
-      link.href = url;
-      link.download = `reporte-${new Date().toISOString().split('T')[0]}.json`;
-      document.body.appendChild(link);
-      link.click();
-      document.body.removeChild(link);
-      toast.success('Reporte exportado exitosamente');
-    } catch (error) {
-      toast.error('Error al exportar reporte');
-    }
+  const handleExport = () => {
+    // The backend streams the file, so let the browser download it directly
+    // instead of buffering the whole export in memory first.
+    const link = document.createElement('a');
+    link.href = `${API}/reports/export?format=json`;
+    link.download = `reporte-${new Date().toISOString().split('T')[0]}.json`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    toast.success('Exportación iniciada');
   };
 
+  const maxCollected = Math.max(...daily.map((day) => day.amount_collected), 1);
+
   if (loading) {
     return <div className="text-center py-12">Cargando...</div>;
   }
@@ -104,6 +114,92 @@ const ReportsPage = () => {
         </Card>
       </div>
 
+      {/* Breakdown Cards */}
+      <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+        {[
+          { title: 'Por Estado', rows: summary?.by_status, testId: 'report-by-status' },
+          { title: 'Por Tipo de Producto', rows: summary?.by_product_type, testId: 'report-by-product-type' },
+        ].map(({ title, rows, testId }) => (
+          <Card key={testId} className="border-0 shadow-lg glass" data-testid={testId}>
+            <CardHeader>
+              <CardTitle className="text-sm text-gray-600">{title}</CardTitle>
+            </CardHeader>
+            <CardContent className="space-y-2">
+              {(rows || []).map((row) => (
+                <div key={row.key} className="flex justify-between text-gray-700">
+                  <span className="capitalize">{row.key} ({row.debt_count})</span>
+                  <span className="font-semibold">${row.remaining_amount.toFixed(2)}</span>
+                </div>
+              ))}
+            </CardContent>
+          </Card>
+        ))}
+      </div>
+
+      {/* Daily Trend */}
+      <Card className="border-0 shadow-lg glass" data-testid="report-daily-trend">
+        <CardHeader>
+          <CardTitle className="text-sm text-gray-600">Cobrado por Día (últimos 30 días)</CardTitle>
+        </CardHeader>
+        <CardContent>
+          <div className="flex items-end gap-1 h-32">
+            {daily.map((day) => (
+              <div
+                key={day.day}
+                title={`${day.day}: $${day.amount_collected.toFixed(2)} (${day.payments_count} pagos)`}
+                className="flex-1 bg-purple-400 rounded-t"
+                style={{ height: `${(day.amount_collected / maxCollected) * 100}%` }}
+              />
+            ))}
+          </div>
+        </CardContent>
+      </Card>
+
+      {/* Aging & Cash Flow */}
+      <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+        <Card className="border-0 shadow-lg glass" data-testid="report-aging">
+          <CardHeader>
+            <CardTitle className="text-sm text-gray-600">Antigüedad de Saldos</CardTitle>
+          </CardHeader>
+          <CardContent className="space-y-2">
+            {(aging?.buckets || []).map((bucket) => (
+              <div key={bucket.bucket} className="flex justify-between text-gray-700">
+                <span>
+                  {bucket.bucket === 'current' ? 'Al día' : `${bucket.bucket} días`} ({bucket.debt_count})
+                </span>
+                <span className="font-semibold">${bucket.amount.toFixed(2)}</span>
+              </div>
+            ))}
+            <div className="pt-2 border-t space-y-1 text-sm text-gray-600">
+              {[...(aging?.by_product_type || []), ...(aging?.by_installment_type || [])].map((row) => (
+                <div key={row.key} className="flex justify-between">
+                  <span className="capitalize">Morosidad {row.key}</span>
+                  <span>{(row.rate * 100).toFixed(1)}%</span>
+                </div>
+              ))}
+            </div>
+          </CardContent>
+        </Card>
+
+        <Card className="border-0 shadow-lg glass" data-testid="report-cashflow">
+          <CardHeader>
+            <CardTitle className="text-sm text-gray-600">Flujo de Caja Esperado</CardTitle>
+          </CardHeader>
+          <CardContent className="space-y-2">
+            <div className="flex justify-between text-red-600">
+              <span>Vencido</span>
+              <span className="font-semibold">${(cashflow?.overdue_amount || 0).toFixed(2)}</span>
+            </div>
+            {(cashflow?.weeks || []).map((week) => (
+              <div key={week.week_start} className="flex justify-between text-gray-700">
+                <span>Semana del {new Date(week.week_start).toLocaleDateString('es-ES', { timeZone: 'UTC' })}</span>
+                <span className="font-semibold">${week.expected_amount.toFixed(2)}</span>
+              </div>
+            ))}
+          </CardContent>
+        </Card>
+      </div>
+
       {/* Info Card */}
       <Card className="border-0 shadow-lg glass">
         <CardHeader>